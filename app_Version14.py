@@ -1,23 +1,31 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
-from datetime import datetime
-import requests
 import os
-import base64
+import json
+import re
+import uuid
+import figure_cache
+from assets import asset_src, responsive_img
+from lazy_imports import lazy
+
+# 重型依赖按需加载：只有用到它们的页面才会真正导入
+pd = lazy("pandas")
+requests = lazy("requests")
+fish_data = lazy("fish_data")
+pond_store = lazy("pond_store")
+downsample = lazy("downsample")
+media = lazy("media")
+detector = lazy("detector")
+video_analysis = lazy("video_analysis")
+camera = lazy("camera")
+detection_log = lazy("detection_log")
+db = lazy("db")
+ranking = lazy("ranking")
 
 # =============== 新增：登录页面配置 ===============
 APP_DISPLAY_NAME = "👨‍⚕️智能鱼疾检测系统"
 LOGIN_LOGO_PATH = "login_logo.png"   # 可选：登录页左侧图标(建议 128x128 PNG)，没有会使用 emoji
 LOGIN_CARD_WIDTH_PX = 760
 
-def _img_to_base64(path: str):
-    try:
-        with open(path, "rb") as f:
-            return base64.b64encode(f.read()).decode()
-    except Exception:
-        return None
-
 def render_login_page():
     """渲染仅装饰用途的登录页面"""
     st.set_page_config(
@@ -95,18 +103,18 @@ def render_login_page():
     </style>
     """, unsafe_allow_html=True)
 
-    logo_b64 = _img_to_base64(LOGIN_LOGO_PATH)
+    logo_src = asset_src(LOGIN_LOGO_PATH, 70)
 
     st.markdown('<div class="login-wrapper">', unsafe_allow_html=True)
     with st.container():
         st.markdown('<div class="login-card">', unsafe_allow_html=True)
         # 顶部
-        if logo_b64:
+        if logo_src:
             st.markdown(
                 f"""
                 <div class="login-head">
                     <div>
-                        <img src="data:image/png;base64,{logo_b64}" style="width:70px;height:70px;border-radius:18px;box-shadow:0 4px 10px -2px rgba(0,0,0,.15);" />
+                        <img src="{logo_src}" style="width:70px;height:70px;border-radius:18px;box-shadow:0 4px 10px -2px rgba(0,0,0,.15);" />
                     </div>
                     <div style="flex:1 1 auto;">
                         <div class="login-title">{APP_DISPLAY_NAME}</div>
@@ -173,6 +181,13 @@ HOME_WENZI_WIDTH = 520      # 欢迎页主标题 wenzi 宽度（px，居中）
 # 品牌图片路径（请把图片放在应用根目录）
 BRAND_LOGO_PATH = "tu_an.png"   # 左侧图案
 BRAND_TEXT_PATH = "wenzi.png"   # 右侧文字
+CAMERA_REFRESH_SECONDS = 0.5   # 网络摄像头实时画面的刷新间隔
+PREVIEW_MAX_SIDE = 1600        # 识别结果里保存的预览图长边（px）；原图只留在 tiling 的内存映射里
+TREND_TABLE_ROWS = 500         # 趋势分析原始数据表最多显示的行数（取最近的）
+HOT_POST_PREFIXES = ["🥇", "🥈", "🥉"]
+FEED_PAGE_SIZE = 10            # 论坛帖子列表每次加载的条数
+# 主区大图的显示宽度：窄屏占满视口，宽屏减去侧边栏（约 21rem）
+MAIN_IMAGE_SIZES = "(max-width: 768px) 100vw, calc(100vw - 21rem)"
 
 # 设置页面配置（已登录后主应用）
 st.set_page_config(
@@ -257,17 +272,18 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-logo_b64 = _img_to_base64(BRAND_LOGO_PATH)
-wenzi_b64 = _img_to_base64(BRAND_TEXT_PATH)
+# 品牌图片只在进程内编码一次（见 assets.py），这里拿到的是 URL 或记忆化的 data URI
+logo_src = asset_src(BRAND_LOGO_PATH, SIDEBAR_TU_AN_WIDTH)
+wenzi_src = asset_src(BRAND_TEXT_PATH, SIDEBAR_WENZI_WIDTH)
 
 # ---------- 侧边栏：左上角品牌 ----------
 with st.sidebar:
-    if logo_b64 and wenzi_b64:
+    if logo_src and wenzi_src:
         st.markdown(
             f"""
             <div class="sidebar-brand">
-                <img class="sidebar-logo" src="data:image/png;base64,{logo_b64}" />
-                <img class="sidebar-wenzi" src="data:image/png;base64,{wenzi_b64}" />
+                <img class="sidebar-logo" src="{logo_src}" />
+                <img class="sidebar-wenzi" src="{wenzi_src}" />
             </div>
             """,
             unsafe_allow_html=True
@@ -366,17 +382,11 @@ def write_reply_sidebar(post_key="post1"):
                 submit = st.button("立即发布", key=f"{post_key}_submit")
             with c2:
                 refresh = st.button("刷新数据", key=f"{post_key}_refresh")
-            if f"{post_key}_comments" not in st.session_state:
-                st.session_state[f"{post_key}_comments"] = []
             if submit:
                 if not reply:
                     st.warning("请先填写评论内容。")
                 else:
-                    st.session_state[f"{post_key}_comments"].append({
-                        "content": reply,
-                        "author": author or "匿名",
-                        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    })
+                    db.add_comment(db.get_post(post_key)["id"], reply, author or "匿名")
                     st.success("评论已发布！")
             if refresh:
                 st.rerun()
@@ -421,8 +431,9 @@ def call_qwen_api(prompt: str):
 
 # ---------- 主内容 ----------
 if page == PAGE_WELCOME:
-    if wenzi_b64:
-        st.markdown(f'<div class="home-title"><img class="home-wenzi" src="data:image/png;base64,{wenzi_b64}" /></div>', unsafe_allow_html=True)
+    home_wenzi_src = asset_src(BRAND_TEXT_PATH, HOME_WENZI_WIDTH)
+    if home_wenzi_src:
+        st.markdown(f'<div class="home-title"><img class="home-wenzi" src="{home_wenzi_src}" /></div>', unsafe_allow_html=True)
     else:
         st.markdown('<h1 class="main-header">渔康智鉴</h1>', unsafe_allow_html=True)
     st.markdown('<p class="sub-header">基于深度学习和生成式人工智能的多维度鱼类养殖助手</p>', unsafe_allow_html=True)
@@ -431,7 +442,12 @@ if page == PAGE_WELCOME:
     if os.path.exists(video_path):
         left, center, right = st.columns([1, 2, 1])
         with center:
-            st.video(video_path, format="video/mp4", start_time=0)
+            # 已转码时走静态服务：只先加载封面，播放时按 HLS / Range 请求拉分片；否则回退原文件
+            player = media.video_html(video_path)
+            if player:
+                st.markdown(player, unsafe_allow_html=True)
+            else:
+                st.video(video_path, format="video/mp4", start_time=0)
     else:
         st.info("未找到 video-2.mp4，请确保文件位于应用根目录。")
 
@@ -442,51 +458,289 @@ if page == PAGE_WELCOME:
     st.markdown("### 技术架构\n本系统采用先进的深度学习技术和生成式人工智能模型，结合专业鱼类疾病知识库，为鱼类养殖提供全方位的智能支持。")
 
 elif page == PAGE_CAPTURE:
-    img_path = "photo1.jpg"
-    if os.path.exists(img_path):
-        st.image(img_path, use_container_width=True)
+    source = st.session_state.get("source", "图片")
+    confidence = float(st.session_state.get("confidence", 0.90))
+
+    results = st.session_state.get("capture_results")
+    if not results:
+        img_path = "photo1.jpg"
+        if os.path.exists(img_path):
+            # 多宽度 AVIF/WebP 派生图，浏览器按视口挑最小的合适版本；不可用时回退原图
+            picture = responsive_img(img_path, sizes=MAIN_IMAGE_SIZES, alt="识别示例")
+            if picture:
+                st.markdown(picture, unsafe_allow_html=True)
+            else:
+                st.image(img_path, use_container_width=True)
+        else:
+            st.info("未找到 photo1.jpg，请将其放到应用根目录。")
+
+    if source in ("图片", "视频"):
+        with st.expander("📒 记入数据查询", expanded=False):
+            log_enabled = st.checkbox("识别完成后把各类别数量记入数据查询页的时间序列", value=True, key="capture_log")
+            c1, c2 = st.columns(2)
+            log_farm = c1.text_input("养殖场", value=fish_data.DEFAULT_FARM, key="capture_log_farm").strip() or fish_data.DEFAULT_FARM
+            log_pond = c2.text_input("池塘", value=fish_data.DEFAULT_POND, key="capture_log_pond").strip() or fish_data.DEFAULT_POND
+            st.caption(f"写入数据查询页的「{log_farm} / {detection_log.series_pond(log_pond)}」，与盘点数据分开，不计入全部池塘汇总")
+
+    if source == "图片":
+        uploads = st.file_uploader("上传鱼体照片", type=["jpg", "jpeg", "png", "webp"], accept_multiple_files=True, key="capture_images")
+        tiled = st.checkbox(
+            "大图分块检测", value=True, key="capture_tiled",
+            help="整缸、整塘的高分辨率照片切成互相重叠的小块按原分辨率检测，眼部病变、早期溃疡等小病灶更容易检出；块数越多耗时越长",
+        )
+        if st.button("🚀 开始检测", disabled=not uploads):
+            engine = detector.get_engine()
+            if engine is None:
+                st.info(detector.unavailable_reason())
+            else:
+                from PIL import Image
+                import tiling
+                # 每张图解码后立即写入内存映射并释放，会话里只留缩小的预览图
+                frames, digests, previews = [], [], []
+                for f in uploads:
+                    with Image.open(f) as image:
+                        frame, digest = tiling.spill(image)
+                        image.thumbnail((PREVIEW_MAX_SIDE, PREVIEW_MAX_SIDE))
+                        previews.append((image.convert("RGB"), image.width / frame.shape[1]))
+                    frames.append(frame)
+                    digests.append(digest)
+                with st.spinner("正在识别..."):
+                    candidates, hits = detector.analyze(engine, frames, digests, tiled=tiled)
+                del frames
+                # 保存置信度下限以上的候选框，调整滑块时只重做阈值截取与 NMS，不再推理
+                results = [
+                    {"name": f.name, "preview": p, "scale": scale, "candidates": c}
+                    for f, (p, scale), c in zip(uploads, previews, candidates)
+                ]
+                st.session_state["capture_results"] = results
+                st.session_state["capture_cache_hits"] = hits
+                if log_enabled:
+                    shown = [d for c in candidates for d in detector.select(c, confidence)]
+                    detection_log.record(detector.count_by_label(shown), log_farm, log_pond)
+
+        for r in results or []:
+            st.markdown(f"#### {r['name']}")
+            shown = detector.select(r["candidates"], confidence)
+            left, right = st.columns([3, 2])
+            with left:
+                st.image(detector.draw(r["preview"], shown, scale=r["scale"]), use_container_width=True)
+            with right:
+                counts = detector.count_by_label(shown)
+                st.dataframe(pd.DataFrame({"类别": list(counts), "数量": list(counts.values())}), hide_index=True, use_container_width=True)
+                if not shown:
+                    st.caption(f"置信度 ≥ {confidence:.2f} 时未检测到目标")
+        if results:
+            engine = detector.get_engine()
+            model_name = detector.get_detector().name if engine is not None else ""
+            hits = st.session_state.get("capture_cache_hits", 0)
+            if hits:
+                model_name += f" · 结果缓存命中 {hits}/{len(results)} 张"
+            if engine is not None and getattr(engine, "server", None) is None:
+                st.caption(f"模型 {model_name} · 检测进程池：{engine.n} 个进程 · 自动重启 {engine.restarts} 次")
+            elif engine is not None:
+                m = engine.server.metrics()
+                st.caption(
+                    f"模型 {model_name} · 推理队列：排队 {m['queue_depth']} · 已处理 {m['items']} 张 / {m['batches']} 批"
+                    f"（平均批大小 {m['mean_batch']:.1f}）· 每批延迟 p50 {m['latency_p50_ms']:.0f} ms / p95 {m['latency_p95_ms']:.0f} ms"
+                )
+    elif source == "视频":
+        video = st.file_uploader("上传塘口视频", type=["mp4", "mov", "avi", "mkv"], key="capture_video")
+        c1, c2 = st.columns(2)
+        with c1:
+            sample_mode = st.radio("抽帧方式", ["按帧率", "按场景变化"], horizontal=True, key="capture_sample_mode")
+        with c2:
+            sample_fps = st.slider("抽帧帧率（帧/秒）", 0.5, 5.0, 1.0, 0.5, disabled=sample_mode != "按帧率", key="capture_sample_fps")
+
+        def render_video_summary(state, progress=None, table=None, status=None):
+            rows = pd.DataFrame({
+                "类别": list(state["peak"]),
+                "单帧最多": list(state["peak"].values()),
+                "累计检出（帧次）": list(state["total"].values()),
+            })
+            (st if table is None else table).dataframe(rows, hide_index=True, use_container_width=True)
+            if progress is not None:
+                progress.progress(min(state["t"] / state["duration"], 1.0) if state["duration"] else 1.0)
+            (st if status is None else status).caption(
+                f"已抽取 {state['sampled']} 帧，推理 {state['analyzed']} 帧，跳过重复/无变化画面 {state['skipped']} 帧"
+            )
+
+        if st.button("🚀 开始检测", disabled=video is None):
+            engine = detector.get_engine()
+            if engine is None:
+                st.info(detector.unavailable_reason())
+            elif not video_analysis.available():
+                st.info("未找到 ffmpeg，无法解码视频，请先安装 ffmpeg。")
+            else:
+                import tempfile
+                suffix = os.path.splitext(video.name)[1]
+                with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+                    tmp.write(video.getbuffer())
+                progress, table, status = st.progress(0.0), st.empty(), st.empty()
+                try:
+                    state = None
+                    for state in video_analysis.analyze(tmp.name, engine, confidence, fps=sample_fps, scene=sample_mode == "按场景变化"):
+                        render_video_summary(state, progress, table, status)
+                    st.session_state["capture_video_result"] = {"name": video.name, "state": state}
+                    if log_enabled and state is not None:
+                        # 视频按单帧最多的数量记，避免同一条鱼在多帧里重复计数
+                        detection_log.record(state["peak"], log_farm, log_pond)
+                except RuntimeError as e:
+                    st.error(f"视频读取失败：{e}")
+                finally:
+                    os.remove(tmp.name)
+        elif st.session_state.get("capture_video_result"):
+            last = st.session_state["capture_video_result"]
+            st.markdown(f"#### {last['name']}")
+            render_video_summary(last["state"])
     else:
-        st.info("未找到 photo1.jpg，请将其放到应用根目录。")
+        camera_mode = st.radio("接入方式", ["网络摄像头", "浏览器摄像头"], horizontal=True, key="camera_mode")
+        engine = detector.get_detector()
+        if engine is None:
+            st.info(detector.unavailable_reason())
+        elif camera_mode == "网络摄像头":
+            url = st.text_input("摄像头地址", placeholder="rtsp://用户名:密码@192.168.1.64:554/Streaming/Channels/102", key="camera_url")
+            c1, c2 = st.columns(2)
+            with c1:
+                start = st.button("▶️ 开始实时检测", disabled=not url)
+            with c2:
+                stop = st.button("⏹️ 停止", disabled="camera_live" not in st.session_state)
+            if start:
+                if not video_analysis.available():
+                    st.info("未找到 ffmpeg，无法读取摄像头视频流，请先安装 ffmpeg。")
+                else:
+                    # 流水线按地址在会话间共享，停止时只注销本会话
+                    viewer = st.session_state.setdefault("camera_viewer", uuid.uuid4().hex)
+                    try:
+                        camera.open_stream(url, engine, confidence, viewer)
+                        previous = st.session_state.get("camera_live")
+                        if previous not in (None, url):
+                            camera.close_stream(previous, viewer)
+                        st.session_state["camera_live"] = url
+                    except Exception as e:
+                        st.error(f"无法连接摄像头：{e}")
+            if stop:
+                camera.close_stream(st.session_state.pop("camera_live"), st.session_state["camera_viewer"])
+
+            @st.fragment(run_every=CAMERA_REFRESH_SECONDS)
+            def live_view():
+                live_url = st.session_state.get("camera_live")
+                pipeline = camera.get_stream(live_url) if live_url else None
+                if pipeline is None:
+                    return
+                image, dets, stats = pipeline.latest()
+                if pipeline.error:
+                    st.error(f"视频流中断：{pipeline.error}")
+                elif image is None:
+                    st.caption("正在连接摄像头…")
+                else:
+                    st.image(camera.overlay(image, dets, stats), use_container_width=True)
+                    counts = detector.count_by_label(dets)
+                    st.caption(
+                        " · ".join(f"{k} {v}" for k, v in counts.items())
+                        + f"｜延迟 {stats['latency_ms']:.0f} ms（p95 {stats['latency_p95_ms']:.0f} ms）· {stats['fps']:.1f} FPS · 丢弃过时帧 {stats['dropped']}"
+                    )
+
+            live_view()
+        else:
+            try:
+                from streamlit_webrtc import webrtc_streamer
+            except ImportError:
+                webrtc_streamer = None
+            if webrtc_streamer is not None:
+                pipeline = st.session_state.get("camera_pipeline")
+                if pipeline is None or not pipeline.stats()["running"] or pipeline.engine is not engine:
+                    pipeline = st.session_state["camera_pipeline"] = camera.LivePipeline(engine, confidence)
+                pipeline.conf = confidence
+                webrtc_streamer(
+                    key="fish-camera", video_frame_callback=camera.webrtc_callback(pipeline),
+                    media_stream_constraints={"video": True, "audio": False}, async_processing=True,
+                )
+            else:
+                # 未安装 streamlit-webrtc 时退化为拍照识别
+                snapshot = st.camera_input("拍照识别")
+                if snapshot is not None:
+                    from PIL import Image
+                    image = Image.open(snapshot)
+                    image.load()
+                    dets = engine.detect(image, confidence)
+                    st.image(detector.draw(image, dets), use_container_width=True)
+                    st.caption(" · ".join(f"{k} {v}" for k, v in detector.count_by_label(dets).items()))
 
 elif page == PAGE_DATA:
     st.markdown('<h1 class="main-header">🔍 数据查询</h1>', unsafe_allow_html=True)
     try:
-        df = pd.read_excel("data.xlsx")
-        df.columns = [str(c).strip() for c in df.columns]
-
-        category_cols = [
-            c for c in df.columns
-            if (not str(c).startswith("Unnamed")) and c not in ("鱼类总数", "时间", "患病总数")
-        ]
-
-        dist_series = pd.to_numeric(df.loc[0, category_cols], errors="coerce").fillna(0)
-
-        total_val = pd.to_numeric(df.loc[0, "鱼类总数"], errors="coerce")
-        if pd.isna(total_val) or total_val <= 0:
-            total_val = float(dist_series.sum())
+        pond_store.sync()
+        detection_log.flush()           # 识别页写入预写日志、尚未刷入的检测结果
 
-        df_display = pd.DataFrame({
-            "类别": category_cols,
-            "数量": dist_series.values.astype(int),
-            "占比(%)": (dist_series / total_val * 100).round(2)
-        })
+        # 侧边栏：逐日数据追加（只写入对应池塘分区，增量更新统计）
+        with st.sidebar:
+            with st.expander("📥 追加数据", expanded=False):
+                st.caption("CSV / XLSX / JSON，每行一天：日期 + 患病总数（可含各类别、鱼类总数、养殖场、池塘列）")
+                cur_farm = st.session_state.get("data_farm", pond_store.ALL)
+                cur_pond = st.session_state.get("data_pond", pond_store.ALL)
+                up_farm = st.text_input("养殖场", value=cur_farm if cur_farm != pond_store.ALL else fish_data.DEFAULT_FARM, key="append_farm")
+                up_pond = st.text_input("池塘", value=cur_pond if cur_pond != pond_store.ALL else fish_data.DEFAULT_POND, key="append_pond")
+                up_file = st.file_uploader("选择文件", type=["csv", "xlsx", "json"], key="append_file")
+                if st.button("追加", key="append_submit"):
+                    if up_file is None:
+                        st.warning("请先选择文件。")
+                    else:
+                        try:
+                            rows = fish_data.parse_rows(up_file, up_file.name, up_farm.strip() or fish_data.DEFAULT_FARM, up_pond.strip() or fish_data.DEFAULT_POND)
+                            report = pond_store.append(rows)
+                            st.success(f"已追加 {report['added']} 天数据" + (f"，跳过 {report['skipped']} 天已有日期" if report["skipped"] else ""))
+                        except Exception as e:      # 格式不对、文件损坏（如 xlsx 解压失败）等
+                            st.error(f"追加失败：{e}")
+
+        sel_farm_col, sel_pond_col = st.columns(2)
+        with sel_farm_col:
+            sel_farm = st.selectbox("养殖场", [pond_store.ALL] + pond_store.farms(), key="data_farm")
+        with sel_pond_col:
+            pond_options = [pond_store.ALL] + (pond_store.ponds(sel_farm) if sel_farm != pond_store.ALL else [])
+            sel_pond = st.selectbox("池塘", pond_options, key="data_pond")
+
+        # 单个池塘只读它自己的分区；“全部”读预先汇总好的结果
+        if sel_farm == pond_store.ALL:
+            long_df = pond_store.read_rollup()
+        elif sel_pond == pond_store.ALL:
+            long_df = pond_store.read_rollup(sel_farm)
+        else:
+            long_df = pond_store.read_entity(sel_farm, sel_pond)
+        df_display, total_val = fish_data.distribution(long_df)
         df_display_total = pd.concat([df_display, pd.DataFrame([{"类别": "总数", "数量": int(round(total_val)), "占比(%)": 100.00}])], ignore_index=True)
 
         st.success("数据加载成功！")
+        data_ver = pond_store.data_version()
+        info = pond_store.cache_info()
+        fig_info = figure_cache.cache_info()
+        st.caption(
+            f"数据缓存：命中 {info['hits']} 次 / 未命中 {info['misses']} 次 ｜ "
+            f"图表缓存：命中 {fig_info['hits']} 次 / 未命中 {fig_info['misses']} 次"
+        )
         st.subheader("原始数据（清洗后）")
         st.dataframe(df_display_total, use_container_width=True)
 
         col1, col2 = st.columns(2)
         with col1:
             st.subheader("鱼类健康状况分布（柱状图）")
-            st.bar_chart(df_display.set_index('类别')[['数量']], use_container_width=True)
+            bar_spec = figure_cache.get_spec(data_ver, "bar", (sel_farm, sel_pond), lambda: json.dumps({
+                "data": {"values": df_display[["类别", "数量"]].to_dict("records")},
+                "mark": "bar",
+                "encoding": {
+                    "x": {"field": "类别", "type": "nominal", "sort": None, "axis": {"labelAngle": 0}},
+                    "y": {"field": "数量", "type": "quantitative"},
+                },
+            }, ensure_ascii=False))
+            st.vega_lite_chart(json.loads(bar_spec), use_container_width=True)
 
         with col2:
             st.subheader("鱼类健康状况分布（饼图）")
             try:
                 import plotly.express as px
-                fig = px.pie(df_display, values="数量", names="类别", title="鱼类健康状况分布")
-                st.plotly_chart(fig, use_container_width=True)
+                import plotly.io as pio
+                pie_spec = figure_cache.get_spec(data_ver, "pie", (sel_farm, sel_pond), lambda: px.pie(
+                    df_display, values="数量", names="类别", title="鱼类健康状况分布").to_json())
+                st.plotly_chart(pio.from_json(pie_spec), use_container_width=True)
             except ImportError:
                 st.info("饼图需要 plotly 库支持。请在 requirements.txt 中添加 'plotly>=5.15.0'")
 
@@ -494,70 +748,76 @@ elif page == PAGE_DATA:
         with st.expander("📈 趋势分析", expanded=False):
             st.subheader("患病鱼总数随时间变化趋势")
 
-            first_col = df.columns[0]
-            time_row_idx = df.index[df[first_col].astype(str).str.contains("时间", na=False)]
-            sick_row_idx = df.index[df[first_col].astype(str).str.contains("患病总数", na=False)]
-
-            if len(time_row_idx) and len(sick_row_idx):
-                time_pos = df.index.get_loc(time_row_idx[0])
-                sick_pos = df.index.get_loc(sick_row_idx[0])
-
-                time_row = pd.Series(df.iloc[time_pos, 1:]).replace("None", np.nan).dropna()
-                sick_row = pd.Series(df.iloc[sick_pos, 1:]).replace("None", np.nan)
-                sick_row = pd.to_numeric(sick_row, errors="coerce").dropna()
-
-                min_len = min(len(time_row), len(sick_row))
-                time_row = time_row.iloc[:min_len]
-                sick_row = sick_row.iloc[:min_len]
-
-                time_num = pd.to_numeric(time_row, errors="coerce")
-                time_dt = pd.to_datetime(time_num, unit="D", origin="1899-12-30", errors="coerce")
-                if time_dt.isna().any():
-                    time_dt = pd.to_datetime(time_row.astype(str), errors="coerce")
-
-                trend_df = pd.DataFrame({
-                    "时间": time_dt.to_numpy(),
-                    "患病鱼总数": sick_row.to_numpy()
-                }).dropna().reset_index(drop=True)
-
-                if len(trend_df) == 0:
-                    st.info("趋势数据无法解析，请检查 Excel 中“时间/患病总数”两行数据格式。")
-                else:
-                    show_df = trend_df.copy()
-                    if np.issubdtype(show_df["时间"].dtype, np.datetime64):
-                        show_df["时间"] = pd.to_datetime(show_df["时间"]).dt.strftime("%Y-%m-%d")
-                    st.markdown("#### 趋势分析原始数据（对齐后）")
-                    st.dataframe(show_df, use_container_width=True)
-
-                    try:
-                        import plotly.express as px
+            sick = fish_data.metric_series(long_df, fish_data.SICK_METRIC)
+            if len(sick) == 0:
+                st.info("未找到可用的趋势数据，请检查 Excel 中“时间/患病总数”两行的结构与格式。")
+            else:
+                # 缩小时间范围时按全分辨率重新查询，绘图点数始终受像素预算限制
+                first_day, last_day = sick.index[0].to_pydatetime(), sick.index[-1].to_pydatetime()
+                range_start, range_end = None, None
+                if first_day < last_day:
+                    range_start, range_end = st.slider(
+                        "时间范围", min_value=first_day, max_value=last_day, value=(first_day, last_day),
+                        format="YYYY-MM-DD", key=f"trend_range_{sel_farm}_{sel_pond}"
+                    )
+                    sick = fish_data.metric_series(long_df, fish_data.SICK_METRIC, range_start, range_end)
+                plot_sick = downsample.downsample(sick, downsample.PIXEL_BUDGET)
+
+                trend_df = pd.DataFrame({"时间": plot_sick.index, "患病鱼总数": plot_sick.to_numpy()})
+                # 识别页写入的检测结果带时刻，同一天可能有多条
+                time_fmt = "%Y-%m-%d" if (sick.index == sick.index.normalize()).all() else "%Y-%m-%d %H:%M"
+                # 表格只取最近的若干行再格式化，长序列不必逐点 strftime、整表下发
+                recent = sick.iloc[-TREND_TABLE_ROWS:]
+                show_df = pd.DataFrame({"时间": recent.index.strftime(time_fmt), "患病鱼总数": recent.to_numpy()})
+                st.markdown("#### 趋势分析原始数据（对齐后）")
+                st.dataframe(show_df, use_container_width=True)
+                if len(recent) < len(sick):
+                    st.caption(f"共 {len(sick)} 个数据点，表格仅显示最近 {len(recent)} 个；调整时间范围可查看更早的数据。")
+
+                try:
+                    import plotly.express as px
+                    import plotly.io as pio
+
+                    def build_trend_fig():
                         fig = px.line(trend_df, x="时间", y="患病鱼总数",
                                       title="患病鱼总数随时间变化趋势",
                                       labels={"时间": "时间", "患病总数": "患病鱼总数"})
                         fig.update_traces(line=dict(color='gray', width=3))
-                        fig.update_traces(mode='lines+markers', marker=dict(size=6))
+                        if len(plot_sick) == len(sick):
+                            fig.update_traces(mode='lines+markers', marker=dict(size=6))
                         fig.update_layout(plot_bgcolor='rgba(0,0,0,0)', font=dict(size=12))
-                        st.plotly_chart(fig, use_container_width=True)
-
-                        st.markdown("**趋势分析要点：**")
-                        if len(trend_df) > 1:
-                            max_sick = int(trend_df["患病鱼总数"].max())
-                            min_sick = int(trend_df["患病鱼总数"].min())
-                            avg_sick = float(trend_df["患病鱼总数"].mean())
-                            st.write(f"- 最高患病数：{max_sick} 尾")
-                            st.write(f"- 最低患病数：{min_sick} 尾")
-                            st.write(f"- 平均患病数：{avg_sick:.1f} 尾")
-
-                            if trend_df["患病鱼总数"].iloc[-1] > trend_df["患病鱼总数"].iloc[0]:
-                                st.write("- 📈 总体呈上升趋势，需加强疾病防控")
-                            elif trend_df["患病鱼总数"].iloc[-1] < trend_df["患病鱼总数"].iloc[0]:
-                                st.write("- 📉 总体呈下降趋势，防控措施有效")
-                            else:
-                                st.write("- ➡️ 患病数量保持稳定")
-                    except ImportError:
-                        st.info("折线图需要 plotly 库支持。请在 requirements.txt 中添加 'plotly>=5.15.0'")
-            else:
-                st.info("未在首列找到“时间”或“患病总数”两行，请检查 Excel 表结构。")
+                        return fig.to_json()
+
+                    line_spec = figure_cache.get_spec(
+                        data_ver, "trend", (sel_farm, sel_pond, range_start, range_end, downsample.PIXEL_BUDGET), build_trend_fig)
+                    st.plotly_chart(pio.from_json(line_spec), use_container_width=True)
+                    if len(plot_sick) < len(sick):
+                        st.caption(f"共 {len(sick)} 个数据点，图中按 LTTB 降采样显示 {len(plot_sick)} 个；缩小时间范围可查看更多细节。")
+
+                    st.markdown("**趋势分析要点：**")
+                    # 区间统计来自随数据维护的 TrendIndex，与序列长度无关
+                    stats = pond_store.trend_index(
+                        None if sel_farm == pond_store.ALL else sel_farm,
+                        None if sel_pond == pond_store.ALL else sel_pond,
+                    ).query(range_start, range_end)
+                    if stats and stats["n"] > 1:
+                        st.write(f"- 最高患病数：{int(stats['max'])} 尾")
+                        st.write(f"- 最低患病数：{int(stats['min'])} 尾")
+                        st.write(f"- 平均患病数：{stats['mean']:.1f} 尾")
+
+                        # 用最小二乘斜率判断方向：整个区间拟合变化不足 1 尾视为稳定
+                        span_days = (stats["last_date"] - stats["first_date"]).total_seconds() / 86400
+                        fitted_change = stats["slope"] * span_days
+                        if fitted_change >= 1:
+                            st.write(f"- 📈 总体呈上升趋势（约 {stats['slope']:+.2f} 尾/天），需加强疾病防控")
+                        elif fitted_change <= -1:
+                            st.write(f"- 📉 总体呈下降趋势（约 {stats['slope']:+.2f} 尾/天），防控措施有效")
+                        else:
+                            st.write("- ➡️ 患病数量保持稳定")
+                        if stats["change_point"]:
+                            st.write("- ⚠️ 区间内患病数出现明显突变，建议排查对应日期的水质与投喂记录")
+                except ImportError:
+                    st.info("折线图需要 plotly 库支持。请在 requirements.txt 中添加 'plotly>=5.15.0'")
 
         st.markdown("## 💡 建议")
         st.markdown('<div class="ai-hr-line"></div>', unsafe_allow_html=True)
@@ -577,7 +837,7 @@ elif page == PAGE_DATA:
             """)
     except Exception as e:
         st.error(f"数据加载失败: {str(e)}")
-        st.info("请确保 data.xlsx 文件存在于当前目录中")
+        st.info("请确保 data.xlsx 文件存在于当前目录中（多池塘数据放在 ponds/<养殖场>.xlsx，每个工作表一个池塘）")
 
 elif page == PAGE_FORUM:
     if st.session_state.get("forum_view") == "detail_post1":
@@ -602,10 +862,11 @@ elif page == PAGE_FORUM:
 """
         st.markdown(content_html, unsafe_allow_html=True)
 
-        if st.session_state.get("post1_comments"):
+        post_comments = db.comments(db.get_post("post1")["id"], 10)
+        if post_comments:
             st.markdown("### 最新回复")
-            for c in reversed(st.session_state["post1_comments"][-10:]):
-                st.markdown(f"- {c['content']}  — {c['author']} 于 {c['time']}")
+            for c in post_comments:
+                st.markdown(f"- {c['content']}  — {c['author']} 于 {c['created_at']}")
 
     else:
         with st.sidebar:
@@ -617,91 +878,70 @@ elif page == PAGE_FORUM:
                 c1, c2 = st.columns(2)
                 with c1: submit = st.button("立即发布")
                 with c2: refresh = st.button("刷新数据")
-                if "forum_posts" not in st.session_state:
-                    st.session_state.forum_posts = []
                 if submit:
                     if not title or not content:
                         st.warning("请填写完整的标题和内容后再发布。")
                     else:
-                        st.session_state.forum_posts.append({
-                            "title": title, "content": content, "author": author or "匿名",
-                            "pinned": pin, "heat": 0,
-                            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        })
+                        db.add_post(title, content, author or "匿名", pin)
+                        st.session_state.pop("forum_feed", None)
                         st.success("发布成功！已加入最新帖子。")
                 if refresh:
+                    st.session_state.pop("forum_feed", None)
                     st.rerun()
 
         st.markdown('<div class="forum-title">📢 交流论坛</div>', unsafe_allow_html=True)
         st.markdown('<div class="forum-section-title">🔥 热门帖子</div>', unsafe_allow_html=True)
 
-        hot_posts = [
-            {"prefix": "🥇", "title": "乌鳢(黑鱼)养殖出现烂鳃病如何防治？", "heat": 42, "author": "云南黑鱼养殖户", "time": "2025-09-03 14:31:00"},
-            {"prefix": "🥈", "title": "稻田养鲫鱼如何防除敌害？", "heat": 29, "author": "广东鲫鱼养殖户", "time": "2025-08-02 18:24:00"},
-            {"prefix": "🥉", "title": "养泥鳅水质优劣如何观察及处理方法？", "heat": 21, "author": "湖北泥鳅养殖户", "time": "2025-09-20 10:49:00"},
-        ]
-        for i, p in enumerate(hot_posts):
-            heat_pct = max(0, min(100, int(p["heat"])))
+        def render_post_card(p, key, prefix=""):
+            # 热度随时间衰减（半衰期 ranking.HALF_LIFE_HOURS 小时），浏览、点赞、回复都会增加热度
+            heat_now = ranking.current(p["hot"])
+            heat_pct = max(0, min(100, int(heat_now)))
             card = st.container()
             with card:
-                tcol, bcol = st.columns([0.85, 0.15])
+                tcol, lcol, bcol = st.columns([0.75, 0.1, 0.15])
                 with tcol:
-                    st.markdown(f'<div class="post-title">{p["prefix"]} {p["title"]}</div>', unsafe_allow_html=True)
+                    st.markdown(f'<div class="post-title">{prefix}{p["title"]}</div>', unsafe_allow_html=True)
+                with lcol:
+                    if st.button("👍", key=f"like_{key}", help="点赞", use_container_width=True):
+                        db.record_event(p["id"], "like")
+                        st.session_state.pop("forum_feed", None)
+                        st.rerun()
                 with bcol:
-                    if st.button("阅读全文", key=f"hot_read_{i}", help="查看此帖详情", type="secondary", use_container_width=True):
-                        if i == 0:
+                    if st.button("阅读全文", key=key, help="查看此帖详情", type="secondary", use_container_width=True):
+                        db.record_event(p["id"], "view")
+                        if p["slug"] == "post1":
                             st.session_state["forum_view"] = "detail_post1"
                         else:
                             st.info("该帖详情页即将上线～")
-                st.markdown(f'<div class="post-meta">作者：{p["author"]} | 发布时间：{p["time"]}</div>', unsafe_allow_html=True)
+                st.markdown(f'<div class="post-meta">作者：{p["author"]} | 发布时间：{p["created_at"]}</div>', unsafe_allow_html=True)
                 st.markdown(f'''
 <div class="heat-wrap">
-  <div class="heat-label">热度值：{p["heat"]}</div>
+  <div class="heat-label">热度值：{heat_now:.1f}（累计互动 {p["heat"]} 次）</div>
   <div class="heat-track"><div class="heat-fill" style="width:{heat_pct}%;"></div></div>
 </div>
 ''', unsafe_allow_html=True)
 
-        st.markdown('<div class="forum-section-title" style="margin-top:0.75rem;">📰 最新帖子</div>', unsafe_allow_html=True)
-
-        if "forum_posts" in st.session_state and st.session_state.forum_posts:
-            for j, p in enumerate(reversed(st.session_state.forum_posts[-3:])):
-                heat_val = int(p.get("heat", 0))
-                heat_pct = max(0, min(100, heat_val))
-                card = st.container()
-                with card:
-                    tcol, bcol = st.columns([0.85, 0.15])
-                    with tcol:
-                        st.markdown(f'<div class="post-title">🆕 {p["title"]}</div>', unsafe_allow_html=True)
-                    with bcol:
-                        st.button("阅读全文", key=f"latest_user_read_{j}", type="secondary", use_container_width=True)
-                    st.markdown(f'''
-<div class="heat-wrap">
-  <div class="heat-label">热度值：{p["heat"]:02d}</div>
-  <div class="heat-track"><div class="heat-fill" style="width:{heat_pct}%;"></div></div>
-''', unsafe_allow_html=True)
-                    st.markdown(f'<div class="post-meta">作者：{p.get("author","匿名")} | 发布时间：{p.get("created_at","")}</div>', unsafe_allow_html=True)
-
-        latest_posts = [
-            {"title": "如何降低泥鳅的饲养成本？", "heat": 4, "author": "湖北泥鳅养殖户", "time": "2025-10-03 10:49:00"},
-            {"title": "怎么在鲟鱼水花开口期提高养殖收益？", "heat": 3, "author": "浙江鲟鱼养殖户", "time": "2025-10-02 15:22:00"},
-            {"title": "鲶鱼养殖如何增产？", "heat": 7, "author": "四川鲶鱼养殖户", "time": "2025-10-01 12:48:00"},
-        ]
-        for k, p in enumerate(latest_posts):
-            heat_pct = max(0, min(100, int(p["heat"])))
-            card = st.container()
-            with card:
-                tcol, bcol = st.columns([0.85, 0.15])
-                with tcol:
-                    st.markdown(f'<div class="post-title">{p["title"]}</div>', unsafe_allow_html=True)
-                with bcol:
-                    st.button("阅读全文", key=f"latest_read_{k}", type="secondary", use_container_width=True)
-                st.markdown(f'''
-<div class="heat-wrap">
-  <div class="heat-label">热度值：{p["heat"]:02d}</div>
-  <div class="heat-track"><div class="heat-fill" style="width:{heat_pct}%;"></div></div>
-</div>
-''', unsafe_allow_html=True)
-                st.markdown(f'<div class="post-meta">作者：{p["author"]} | 发布时间：{p["time"]}</div>', unsafe_allow_html=True)
+        # 热门（按衰减热度）、最新都由数据库按索引取出，页面不再排序切片
+        for i, p in enumerate(db.hot_posts(len(HOT_POST_PREFIXES))):
+            render_post_card(p, f"hot_read_{p['id']}", f"{HOT_POST_PREFIXES[i]} ")
+
+        st.markdown('<div class="forum-section-title" style="margin-top:0.75rem;">📰 全部帖子</div>', unsafe_allow_html=True)
+        feed_order = st.radio("排序", ["最新发布", "热度最高"], horizontal=True, key="forum_feed_order", label_visibility="collapsed")
+        order = "latest" if feed_order == "最新发布" else "hot"
+        # 键集分页：会话里只存已加载的帖子和下一页游标，“加载更多”从游标处接着取一页
+        feed = st.session_state.get("forum_feed")
+        if feed is None or feed["order"] != order:
+            rows, cursor = db.feed(order, None, FEED_PAGE_SIZE)
+            feed = st.session_state["forum_feed"] = {"order": order, "rows": rows, "cursor": cursor}
+        for p in feed["rows"]:
+            render_post_card(p, f"feed_read_{p['id']}", "🆕 " if p["slug"] is None else "")
+        if feed["cursor"] is not None:
+            if st.button("加载更多", key="forum_load_more"):
+                rows, feed["cursor"] = db.feed(order, feed["cursor"], FEED_PAGE_SIZE)
+                feed["rows"].extend(rows)
+                st.rerun()
+        else:
+            st.caption("已经到底啦")
 
 elif page == PAGE_QA:
     st.markdown('<h1 class="main-header">🧠渔康智鉴AI助手</h1>', unsafe_allow_html=True)
@@ -710,11 +950,19 @@ elif page == PAGE_QA:
 
     st.markdown('<h4 class="section-label">试试这些常见问题：</h4>', unsafe_allow_html=True)
     col1, col2 = st.columns(2)
+    # 对话记录按浏览器会话存在数据库里：随机 id 同时放进网址参数，刷新页面不丢失；
+    # 登录只是展示用，不能拿用户名当键，否则访客共用一份记录、谁都能读到别人的对话
+    if "chat_session" not in st.session_state:
+        sid = st.query_params.get("chat", "")
+        st.session_state.chat_session = sid if re.fullmatch(r"[0-9a-f]{32}", sid) else uuid.uuid4().hex
+    if st.query_params.get("chat") != st.session_state.chat_session:
+        st.query_params["chat"] = st.session_state.chat_session
+    chat_session = st.session_state.chat_session
     def ask_and_show(q):
-        st.session_state.setdefault("messages", []).append({"role": "user", "content": q})
+        db.add_message(chat_session, "user", q)
         with st.spinner("思考中..."):
             a = call_qwen_api(q)
-        st.session_state["messages"].append({"role": "assistant", "content": a})
+        db.add_message(chat_session, "assistant", a)
     with col1:
         if st.button("草鱼患溃疡病如何治疗？", key="q1"): ask_and_show("草鱼患溃疡病如何治疗？")
         if st.button("鲢鱼同时患眼部病变、鳍部病变如何治疗？", key="q2"): ask_and_show("鲢鱼同时患眼部病变、鳍部病变如何治疗？")
@@ -729,18 +977,18 @@ elif page == PAGE_QA:
     )
 
     st.markdown("### 对话记录")
-    for m in st.session_state.get("messages", []):
+    for m in db.messages(chat_session):
         with st.chat_message(m["role"]):
             st.markdown(m["content"])
 
     if prompt := st.chat_input("请输入您的问题..."):
-        st.session_state.setdefault("messages", []).append({"role": "user", "content": prompt})
+        db.add_message(chat_session, "user", prompt)
         with st.chat_message("assistant"):
             with st.spinner("思考中..."):
                 ans = call_qwen_api(prompt)
                 st.markdown(ans)
-                st.session_state["messages"].append({"role": "assistant", "content": ans})
+                db.add_message(chat_session, "assistant", ans)
 
     if st.button("重置会话"):
-        st.session_state["messages"] = []
+        db.clear_messages(chat_session)
         st.rerun()
\ No newline at end of file
@@ -0,0 +1,193 @@
+"""
+品牌图片等静态资源
+- 每张图在进程内只处理一次（按 路径 + mtime + 显示宽度 记忆），缩放到显示宽度的 2 倍并重新压缩
+- 开启 Streamlit 静态服务（server.enableStaticServing）时写到 static/ 下，文件名带内容哈希，
+  页面里只放一个短 URL；否则返回记忆化的 data URI，不再每次重跑都读盘编码
+- app/static 路由不发 Cache-Control，只有 ETag / Last-Modified：浏览器每次加载仍会发条件请求，
+  未变化时回 304、不重传图片；内容哈希保证图片一变 URL 就变，不会拿到旧图
+- 本地大图（识别页示例图、欢迎页横幅）生成多个宽度的 AVIF / WebP 派生图并缓存到磁盘，
+  用 <picture> + srcset 让浏览器按视口选最小的合适版本
+"""
+import base64
+import hashlib
+import io
+import mimetypes
+import os
+import threading
+
+import streamlit as st
+
+try:
+    from PIL import Image, features
+except ImportError:             # 没有 Pillow 时原样使用源文件
+    Image = None
+
+STATIC_DIR = "static"
+BRAND_SUBDIR = "brand"
+RETINA_SCALE = 2                # 按显示宽度的 2 倍输出，高分屏不糊
+WEBP_QUALITY = 90
+DERIVED_SUBDIR = "derived"
+RESPONSIVE_WIDTHS = (480, 960, 1440)
+AVIF_QUALITY = 60
+
+# 静态服务按 mimetypes 猜 Content-Type，且带 nosniff；老版本 Python / 系统 mime.types 可能不认识 .avif
+mimetypes.add_type("image/avif", ".avif")
+mimetypes.add_type("image/webp", ".webp")
+
+_lock = threading.Lock()
+_memo = {}                      # (绝对路径, mtime_ns, size, 宽度, 是否静态) -> src
+_derived = {}                   # 源内容 sha1 -> {mime: [(宽度, URL), ...]}
+_file_digest = {}               # (绝对路径, mtime_ns, size) -> 源内容 sha1
+
+_MIME = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
+
+
+def _encode(path: str, width: int = None):
+    """返回 (字节, 扩展名)；重新编码后更大时保留原文件"""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "rb") as f:
+        raw = f.read()
+    if Image is None:
+        return raw, ext
+    with Image.open(io.BytesIO(raw)) as im:
+        if width and im.width > width * RETINA_SCALE:
+            target = width * RETINA_SCALE
+            im = im.resize((target, max(1, round(im.height * target / im.width))), Image.LANCZOS)
+        buf = io.BytesIO()
+        im.save(buf, format="WEBP", quality=WEBP_QUALITY, method=4)
+    data = buf.getvalue()
+    return (data, ".webp") if len(data) < len(raw) else (raw, ext)
+
+
+def static_enabled():
+    try:
+        return bool(st.get_option("server.enableStaticServing"))
+    except Exception:
+        return False
+
+
+def asset_src(path: str, width: int = None):
+    """
+    返回可直接放进 <img src="..."> 的地址；文件不存在时返回 None。
+    width 为页面上的显示宽度（px），用于决定输出尺寸。
+    """
+    try:
+        st_ = os.stat(path)
+    except OSError:
+        return None
+    static = static_enabled()
+    key = (os.path.abspath(path), st_.st_mtime_ns, st_.st_size, width, static)
+    with _lock:
+        if key in _memo:
+            return _memo[key]
+
+    data, ext = _encode(path, width)
+    if static:
+        digest = hashlib.sha1(data).hexdigest()[:12]
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name = f"{stem}-{width or 'orig'}-{digest}{ext}"
+        out = os.path.join(STATIC_DIR, BRAND_SUBDIR, name)
+        if not os.path.exists(out):
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            with open(out + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(out + ".tmp", out)
+        # 文件名含内容哈希，内容变了 URL 就变；未变化时浏览器靠 ETag 重新验证（304），不会长期免请求缓存
+        src = f"app/static/{BRAND_SUBDIR}/{name}"
+    else:
+        src = f"data:{_MIME.get(ext, 'application/octet-stream')};base64,{base64.b64encode(data).decode()}"
+
+    with _lock:
+        for stale in [k for k in _memo if k[0] == key[0] and k[3:] == key[3:]]:
+            del _memo[stale]            # 源文件已更新，旧版本不再需要
+        _memo[key] = src
+    return src
+
+
+# =============== 响应式派生图 ===============
+def _variants(raw: bytes, stem: str, digest: str, folder: str):
+    """
+    生成各宽度的 AVIF / WebP 以及原格式回退图，已存在的文件直接复用。
+    返回 {mime: [(宽度, URL), ...]}
+    """
+    with Image.open(io.BytesIO(raw)) as im:
+        im.load()
+        has_alpha = im.mode in ("RGBA", "LA", "P")
+        widths = [w for w in RESPONSIVE_WIDTHS if w < im.width] + [im.width]
+        formats = [("image/webp", "WEBP", ".webp", {"quality": WEBP_QUALITY, "method": 4})]
+        if features.check("avif"):
+            formats.insert(0, ("image/avif", "AVIF", ".avif", {"quality": AVIF_QUALITY}))
+        if has_alpha:
+            formats.append(("image/png", "PNG", ".png", {"optimize": True}))
+        else:
+            formats.append(("image/jpeg", "JPEG", ".jpg", {"quality": 85, "progressive": True}))
+
+        out = {}
+        os.makedirs(os.path.join(STATIC_DIR, folder), exist_ok=True)
+        for w in widths:
+            resized = None
+            for mime, fmt, ext, opts in formats:
+                name = f"{stem}-{digest[:12]}-{w}{ext}"
+                path = os.path.join(STATIC_DIR, folder, name)
+                if not os.path.exists(path):
+                    if resized is None:
+                        resized = im if w == im.width else im.resize((w, max(1, round(im.height * w / im.width))), Image.LANCZOS)
+                        if not has_alpha and resized.mode != "RGB":
+                            resized = resized.convert("RGB")
+                    resized.save(path + ".tmp", format=fmt, **opts)
+                    os.replace(path + ".tmp", path)
+                out.setdefault(mime, []).append((w, f"app/static/{folder}/{name}"))
+    return out
+
+
+def _picture_html(variants, sizes: str, alt: str):
+    def srcset(items):
+        return ", ".join(f"{url} {w}w" for w, url in items)
+
+    fallback_mime = "image/png" if "image/png" in variants else "image/jpeg"
+    sources = "".join(
+        f'<source type="{mime}" srcset="{srcset(items)}" sizes="{sizes}">'
+        for mime, items in variants.items() if mime != fallback_mime
+    )
+    fallback = variants[fallback_mime]
+    return (
+        f'<picture>{sources}'
+        f'<img src="{fallback[-1][1]}" srcset="{srcset(fallback)}" sizes="{sizes}" alt="{alt}" '
+        f'loading="lazy" decoding="async" style="width:100%;height:auto;display:block;" />'
+        f'</picture>'
+    )
+
+
+def _responsive(raw: bytes, digest: str, stem: str, folder: str):
+    with _lock:
+        if digest in _derived:
+            return _derived[digest]
+    variants = _variants(raw, stem, digest, folder)
+    with _lock:
+        _derived[digest] = variants
+    return variants
+
+
+def responsive_img(path: str, sizes: str = "100vw", alt: str = ""):
+    """
+    本地大图的 <picture> HTML；派生图在首次请求时生成并缓存到 static/derived/。
+    未开启静态服务、缺少 Pillow 或文件不存在时返回 None，调用方回退到 st.image。
+    """
+    if Image is None or not static_enabled():
+        return None
+    try:
+        st_ = os.stat(path)
+    except OSError:
+        return None
+    fkey = (os.path.abspath(path), st_.st_mtime_ns, st_.st_size)
+    with _lock:
+        variants = _derived.get(_file_digest.get(fkey))
+    if variants is None:
+        with open(path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        stem = os.path.splitext(os.path.basename(path))[0]
+        variants = _responsive(raw, digest, stem, DERIVED_SUBDIR)
+        with _lock:
+            _file_digest[fkey] = digest
+    return _picture_html(variants, sizes, alt)
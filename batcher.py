@@ -0,0 +1,126 @@
+"""
+跨会话共享的微批推理队列
+- 各会话把预处理好的单张输入 submit() 进来，立即拿到 Future
+- 后台线程取到第一个请求后最多再等 max_wait_ms，或凑满 max_batch 张，合成一个批次一次推理
+- 结果按顺序拆回各自的 Future；推理出错时该批次所有请求都收到同一个异常
+- close() 之后还在排队、以及之后才提交的请求都收到 RuntimeError，不会有永远等不到结果的 Future
+- metrics() 给出排队深度、批大小与每批延迟，用于调参
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+MAX_BATCH = int(os.getenv("FISH_MAX_BATCH", "8"))
+MAX_WAIT_MS = float(os.getenv("FISH_MAX_WAIT_MS", "5"))
+METRIC_WINDOW = 256             # 延迟分位数按最近多少个批次计算
+
+_STOP = object()
+
+
+class BatchServer:
+    def __init__(self, run_batch, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+        """run_batch(np.ndarray (N, ...)) -> 长度为 N 的结果序列"""
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._latency = deque(maxlen=METRIC_WINDOW)     # 每批推理耗时（秒）
+        self._waited = deque(maxlen=METRIC_WINDOW)      # 每批第一个请求的排队时间（秒）
+        self._sizes = deque(maxlen=METRIC_WINDOW)
+        self._totals = {"batches": 0, "items": 0, "errors": 0}
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name="batch-server", daemon=True)
+        self._thread.start()
+
+    def submit(self, x: np.ndarray) -> Future:
+        fut = Future()
+        with self._lock:            # 与 close() 互斥：关闭后不会再有请求进队列
+            if not self._closed:
+                self._queue.put((x, fut, time.perf_counter()))
+                return fut
+        fut.set_running_or_notify_cancel()
+        fut.set_exception(RuntimeError("推理队列已关闭"))
+        return fut
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        # 后台线程正在凑的这批照常推理，队列里剩下的在这里统一失败
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError("推理队列已关闭"))
+        self._queue.put(_STOP)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)          # 先把手上这批跑完再退出
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            items = [(x, f) for x, f, _ in batch if f.set_running_or_notify_cancel()]
+            if not items:
+                continue
+            start = time.perf_counter()
+            try:
+                outputs = self.run_batch(np.stack([x for x, _ in items]))
+            except Exception as e:
+                for _, f in items:
+                    f.set_exception(e)
+                with self._lock:
+                    self._totals["errors"] += 1
+                continue
+            elapsed = time.perf_counter() - start
+            for (_, f), out in zip(items, outputs):
+                f.set_result(out)
+            with self._lock:
+                self._latency.append(elapsed)
+                self._waited.append(start - batch[0][2])
+                self._sizes.append(len(items))
+                self._totals["batches"] += 1
+                self._totals["items"] += len(items)
+
+    def metrics(self):
+        with self._lock:
+            latency = np.array(self._latency) * 1000
+            waited = np.array(self._waited) * 1000
+            sizes = list(self._sizes)
+            totals = dict(self._totals)
+        return {
+            **totals,
+            "queue_depth": self._queue.qsize(),
+            "mean_batch": float(np.mean(sizes)) if sizes else 0.0,
+            "latency_p50_ms": float(np.percentile(latency, 50)) if len(latency) else 0.0,
+            "latency_p95_ms": float(np.percentile(latency, 95)) if len(latency) else 0.0,
+            "wait_p95_ms": float(np.percentile(waited, 95)) if len(waited) else 0.0,
+        }
@@ -0,0 +1,82 @@
+"""
+冷启动 XLSX 解析 vs 热 Feather 旁路文件读取的耗时对比
+
+用法（项目根目录）：
+    python -m benchmarks.bench_data_load
+    python -m benchmarks.bench_data_load --sizes 1000 100000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from openpyxl import Workbook
+
+import fish_data
+
+EXCEL_MAX_COLS = 16384
+CATEGORIES = ["鱼类总数", "健康", "患溃疡病", "眼部病变", "鳍部病变", "患腐烂鳃"]
+
+
+def make_workbook(path: str, n_points: int, seed: int = 0):
+    """生成与 data.xlsx 同结构的工作簿；超过单行列数上限时按多组“时间/患病总数”行续写"""
+    rng = np.random.default_rng(seed)
+    serials = 45901 + np.arange(n_points)
+    sick = rng.integers(0, 50, n_points)
+    per_row = EXCEL_MAX_COLS - 1
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(CATEGORIES)
+    ws.append([100, 69, 11, 5, 7, 8])
+    ws.append([])
+    for start in range(0, n_points, per_row):
+        ws.append(["时间"] + serials[start:start + per_row].tolist())
+        ws.append(["患病总数"] + sick[start:start + per_row].tolist())
+    wb.save(path)
+
+
+def _timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def run(sizes, repeat: int):
+    tmp = tempfile.mkdtemp(prefix="fish_bench_")
+    try:
+        print(f"{'点数':>10} {'冷 XLSX(s)':>12} {'热 旁路(s)':>12} {'内存命中(s)':>12} {'加速比':>8}")
+        for n in sizes:
+            path = os.path.join(tmp, f"bench_{n}.xlsx")
+            make_workbook(path, n)
+            sidecar_dir = os.path.join(tmp, fish_data.SIDECAR_DIR)
+
+            def cold():
+                shutil.rmtree(sidecar_dir, ignore_errors=True)
+                fish_data.clear_cache()
+                fish_data.load_workbook(path)
+
+            def warm():
+                fish_data.clear_cache()
+                fish_data.load_workbook(path)
+
+            t_cold = _timed(cold, 1)
+            t_warm = _timed(warm, repeat)
+            t_hit = _timed(lambda: fish_data.load_workbook(path), repeat)
+            print(f"{n:>10} {t_cold:>12.3f} {t_warm:>12.4f} {t_hit:>12.6f} {t_cold / t_warm:>7.0f}x")
+    finally:
+        fish_data.clear_cache()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
@@ -0,0 +1,93 @@
+"""
+论坛帖子列表的分页延迟：键集分页（db.feed）vs OFFSET 分页
+
+在临时数据库里生成 --posts 条帖子（默认 100 万，发布时间与热度随机），
+分别按发布时间 / 热度，从首页开始连续往后翻，并直接跳到不同深度，报告每页查询的 p50 / p95 毫秒数。
+目标：百万帖子下键集分页任意深度每页都在 10 ms 以内。
+
+用法（项目根目录）：
+    python -m benchmarks.bench_forum_feed
+    python -m benchmarks.bench_forum_feed --posts 200000 --page-size 20
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import db
+import ranking
+
+DEPTHS = (0.0, 0.01, 0.1, 0.5, 0.9)     # 直接跳转的深度（占全部帖子的比例）
+
+
+def _fill(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    span = int((datetime(2026, 1, 1) - start).total_seconds())
+    with db.connection() as conn, db._transaction(conn):
+        batch = 50000
+        for i in range(0, n, batch):
+            rows = []
+            for j in range(i, min(i + batch, n)):
+                created = start + timedelta(seconds=rng.randrange(span))
+                heat = int(rng.expovariate(1 / 20))
+                rows.append({
+                    "slug": None, "title": f"帖子 {j}", "content": "", "author": f"养殖户{rng.randrange(5000)}",
+                    "pinned": 0, "heat": heat, "created_at": created.strftime("%Y-%m-%d %H:%M:%S"),
+                    # 发帖事件 + heat 次浏览都按发帖时间计入：热度分数随发帖时间与互动次数变化，键集分页跑在真实的分数分布上
+                    "hot": ranking.combine(ranking.point("post", created), ranking.point("view", created, weight=heat))
+                    if heat else ranking.point("post", created),
+                })
+            conn.executemany(db.SQL_INSERT_POST, rows)
+        conn.execute("ANALYZE")
+
+
+def _ms(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return (time.perf_counter() - t0) * 1000, out
+
+
+def _summary(times):
+    return f"p50 {np.percentile(times, 50):6.2f} ms  p95 {np.percentile(times, 95):6.2f} ms"
+
+
+def run(n_posts: int, page_size: int, pages: int):
+    for order, col in db.FEED_ORDERS.items():
+        # 连续翻页：每页都用上一页的游标
+        times, cursor = [], None
+        for _ in range(pages):
+            t, (rows, cursor) = _ms(lambda: db.feed(order, cursor, page_size))
+            times.append(t)
+            if cursor is None:
+                break
+        print(f"{order:<7} 连续翻 {len(times)} 页          {_summary(times)}")
+
+        # 直接跳到某个深度：游标取该位置的行（OFFSET 只用来找游标，不计时）
+        sql_offset = f"SELECT {db.POST_COLUMNS} FROM posts ORDER BY {col} DESC, id DESC LIMIT ? OFFSET ?"
+        for depth in DEPTHS:
+            offset = int(n_posts * depth)
+            with db.connection() as conn:
+                row = conn.execute(sql_offset, (1, offset)).fetchone()
+            keyset = [_ms(lambda: db.feed(order, (row[col], row["id"]), page_size))[0] for _ in range(20)]
+            with db.connection() as conn:
+                by_offset = [_ms(lambda: conn.execute(sql_offset, (page_size, offset)).fetchall())[0] for _ in range(5)]
+            print(f"{order:<7} 深度 {depth:>4.0%}  键集 {_summary(keyset)}  |  OFFSET {_summary(by_offset)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=1_000_000)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=200)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        t0 = time.perf_counter()
+        _fill(args.posts)
+        print(f"生成 {args.posts} 条帖子用时 {time.perf_counter() - t0:.1f} s")
+        run(args.posts, args.page_size, args.pages)
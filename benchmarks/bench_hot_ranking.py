@@ -0,0 +1,99 @@
+"""
+热门帖子排序：增量时间衰减热度 + 索引取前 K vs 每次渲染全量排序
+
+在临时数据库里生成 --posts 条帖子（发帖时间分布在模拟的 --days 天内），再按时间顺序回放 --events 个互动事件：
+越新的帖子越容易被看到（按帖龄指数衰减挑选），其中浏览 85%、点赞 10%、回复 5%。
+- 每个事件调用 db.record_event，统计单次更新耗时
+- 每隔一段事件取一次前 K 名：索引扫描（db.hot_posts）vs 读出全部帖子按当前热度排序
+- 最后用全部事件直接计算 Σ 权重 × 2^(-帖龄 / 半衰期)，核对索引给出的前 K 名
+
+用法（项目根目录）：
+    python -m benchmarks.bench_hot_ranking
+    python -m benchmarks.bench_hot_ranking --posts 200000 --events 500000 --top 10
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import db
+import ranking
+
+KINDS = ["view", "like", "reply"]
+KIND_P = [0.85, 0.10, 0.05]
+QUERY_EVERY = 1000              # 每隔多少个事件取一次前 K 名
+
+
+def _summary(times):
+    return f"p50 {np.percentile(times, 50):7.3f} ms  p95 {np.percentile(times, 95):7.3f} ms"
+
+
+def run(n_posts: int, n_events: int, days: float, top: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    start = datetime(2026, 1, 1)
+    created = np.sort(rng.uniform(0, days * 86400, n_posts))       # 相对 start 的秒数，帖子 id 与时间同序
+    with db.connection() as conn, db._transaction(conn):
+        conn.executemany(db.SQL_INSERT_POST, [{
+            "slug": None, "title": f"帖子 {i}", "content": "", "author": "模拟", "pinned": 0, "heat": 0,
+            "created_at": (start + timedelta(seconds=float(t))).strftime("%Y-%m-%d %H:%M:%S"),
+            "hot": ranking.point("post", start + timedelta(seconds=float(t))),
+        } for i, t in enumerate(created)])
+        ids = [r[0] for r in conn.execute("SELECT id FROM posts WHERE author = '模拟' ORDER BY created_at, id")]
+    ids = np.array(ids)
+
+    # 事件时间均匀落在最后一半模拟时间里；每个事件挑一个已发布的帖子，帖龄越小越容易被挑中
+    event_t = np.sort(rng.uniform(days * 86400 / 2, days * 86400, n_events))
+    event_kind = rng.choice(len(KINDS), n_events, p=KIND_P)
+    half_life_s = ranking.HALF_LIFE_HOURS * 3600
+    update_ms, index_ms, full_ms = [], [], []
+    targets = np.empty(n_events, dtype=np.int64)
+    for k in range(n_events):
+        t = event_t[k]
+        published = int(np.searchsorted(created, t))
+        age = rng.exponential(half_life_s)
+        j = int(np.searchsorted(created, t - age))
+        j = min(max(j, 0), published - 1) if published else 0
+        targets[k] = j
+        when = start + timedelta(seconds=float(t))
+        t0 = time.perf_counter()
+        db.record_event(int(ids[j]), KINDS[event_kind[k]], when)
+        update_ms.append((time.perf_counter() - t0) * 1000)
+
+        if k % QUERY_EVERY == 0:
+            t0 = time.perf_counter()
+            db.hot_posts(top)
+            index_ms.append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
+            with db.connection() as conn:
+                rows = conn.execute("SELECT id, hot FROM posts").fetchall()
+            sorted(rows, key=lambda r: -ranking.current(r["hot"], when))[:top]
+            full_ms.append((time.perf_counter() - t0) * 1000)
+
+    print(f"{n_posts} 条帖子，{n_events} 个事件（模拟 {days:g} 天，半衰期 {ranking.HALF_LIFE_HOURS:g} 小时）")
+    print(f"单个事件更新热度        {_summary(update_ms)}")
+    print(f"取前 {top} 名：索引扫描    {_summary(index_ms)}")
+    print(f"取前 {top} 名：全量排序    {_summary(full_ms)}")
+
+    # 核对：直接按定义计算每个帖子在最后时刻的热度
+    end = event_t[-1]
+    weights = np.array([ranking.WEIGHTS[k] for k in KINDS])[event_kind]
+    score = np.exp2(-(end - created) / half_life_s) * ranking.WEIGHTS["post"]
+    np.add.at(score, targets, weights * np.exp2(-(end - event_t) / half_life_s))
+    expected = [int(ids[j]) for j in np.argsort(-score, kind="stable")[:top]]
+    got = [p["id"] for p in db.hot_posts(top) if p["author"] == "模拟"]
+    print(f"前 {top} 名与按定义直接计算的结果一致：{got == expected}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--top", type=int, default=3)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        run(args.posts, args.events, args.days, args.top)
@@ -0,0 +1,160 @@
+"""
+逐日追加（pond_store.append）vs 全量重新同步的耗时，并核对追加后的汇总与全量重建一致
+
+在临时目录里生成 data.xlsx（默认养殖场/1号池）和一个两池塘的养殖场工作簿，同步后追加 --days 轮逐日数据，
+每轮的几种行各覆盖一种情况：
+- 默认池塘：只有部分类别、没有鱼类总数（快照要沿用之前的其余类别和鱼类总数）
+- 养殖场 1 号池：只有患病总数（快照不变）
+- 养殖场 2 号池：鱼类总数 + 全部类别
+最后把工作簿和追加记录复制到另一个目录从头同步，逐项比较两边的汇总快照、汇总长表与统计量。
+
+用法（项目根目录）：
+    python -m benchmarks.bench_pond_append
+    python -m benchmarks.bench_pond_append --points 100000 --days 30
+"""
+import argparse
+import math
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+import fish_data
+import pond_store
+from benchmarks.bench_data_load import CATEGORIES, make_workbook
+
+FARM = "测试养殖场"
+FARM_PONDS = ("1号池", "2号池")
+
+
+def _make_farm(path: str, n_points: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    wb = Workbook(write_only=True)
+    for pond in FARM_PONDS:
+        ws = wb.create_sheet(pond)
+        ws.append(CATEGORIES)
+        ws.append([200] + rng.integers(5, 40, len(CATEGORIES) - 1).tolist())
+        ws.append([])
+        ws.append(["时间"] + (45901 + np.arange(n_points)).tolist())
+        ws.append(["患病总数"] + rng.integers(0, 50, n_points).tolist())
+    wb.save(path)
+
+
+def _reset():
+    pond_store._manifest = None
+    pond_store._part_cache.clear()
+    pond_store._indexes.clear()
+    fish_data.clear_cache()
+
+
+def _rows(farm: str, pond: str, date, values: dict):
+    return fish_data.finish_long(pd.DataFrame({
+        "date": pd.Timestamp(date), "metric": list(values), "value": list(values.values()),
+    }), farm, pond)
+
+
+def _round(day, rng):
+    sick = rng.integers(0, 20, 3).astype(float)
+    return {
+        (fish_data.DEFAULT_FARM, fish_data.DEFAULT_POND): _rows(
+            fish_data.DEFAULT_FARM, fish_data.DEFAULT_POND, day,
+            {"健康": float(rng.integers(60, 95)), "患溃疡病": float(rng.integers(0, 10)), fish_data.SICK_METRIC: sick[0]}),
+        (FARM, FARM_PONDS[0]): _rows(FARM, FARM_PONDS[0], day, {fish_data.SICK_METRIC: sick[1]}),
+        (FARM, FARM_PONDS[1]): _rows(FARM, FARM_PONDS[1], day, {
+            fish_data.TOTAL_METRIC: 200.0, **{c: float(rng.integers(5, 40)) for c in CATEGORIES[1:]},
+            fish_data.SICK_METRIC: sick[2]}),
+    }
+
+
+def _state():
+    """汇总相关的全部可见结果：快照、统计量、汇总长表（按日期 + 指标排序）"""
+    m = pond_store.sync()
+    out = {}
+    for key in [pond_store.ALL_KEY] + pond_store.farms():
+        farm = None if key == pond_store.ALL_KEY else key
+        long_df = pond_store.read_rollup(farm).reset_index()
+        long_df["metric"] = long_df["metric"].astype(str)
+        out[key] = {
+            "snapshot": m["rollups"].get(key),
+            "stats": pond_store.sick_stats(farm),
+            "long": long_df[["date", "metric", "value"]].sort_values(["date", "metric"]).reset_index(drop=True),
+        }
+    return out
+
+
+def _same(a, b, path="", diffs=None):
+    diffs = [] if diffs is None else diffs
+    if isinstance(a, dict) and isinstance(b, dict):
+        for k in set(a) | set(b):
+            _same(a.get(k), b.get(k), f"{path}/{k}", diffs)
+    elif isinstance(a, pd.DataFrame) and isinstance(b, pd.DataFrame):
+        if a.shape != b.shape or not (a["date"].equals(b["date"]) and a["metric"].equals(b["metric"])) \
+                or not np.allclose(a["value"], b["value"]):
+            diffs.append(f"{path}: 汇总长表不同（{len(a)} 行 vs {len(b)} 行）")
+    elif isinstance(a, float) and isinstance(b, float):
+        if not math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9):
+            diffs.append(f"{path}: {a} != {b}")
+    elif a != b:
+        diffs.append(f"{path}: {a!r} != {b!r}")
+    return diffs
+
+
+def run(n_points: int, days: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    cwd = os.getcwd()
+    work, rebuild = tempfile.mkdtemp(prefix="fish_bench_"), tempfile.mkdtemp(prefix="fish_bench_")
+    try:
+        os.chdir(work)
+        make_workbook(fish_data.DATA_PATH, n_points)
+        os.makedirs(pond_store.POND_DATA_DIR)
+        _make_farm(os.path.join(pond_store.POND_DATA_DIR, FARM + ".xlsx"), n_points)
+        _reset()
+        t0 = time.perf_counter()
+        m = pond_store.sync()
+        t_sync = time.perf_counter() - t0
+
+        last = max(pd.Timestamp(e["last_date"]) for e in m["entities"].values())
+        append_ms = []
+        for d in range(1, days + 1):
+            batch = _round(last + pd.Timedelta(days=d), rng)
+            t0 = time.perf_counter()
+            report = pond_store.append(batch)
+            append_ms.append((time.perf_counter() - t0) * 1000)
+            assert report["added"] == len(batch), report
+        appended = _state()
+
+        # 全量重建：同样的工作簿 + 追加记录，在空目录里从头同步
+        for name in (fish_data.DATA_PATH, pond_store.POND_DATA_DIR):
+            src = os.path.join(work, name)
+            (shutil.copytree if os.path.isdir(src) else shutil.copy2)(src, os.path.join(rebuild, name))
+        shutil.copytree(os.path.join(work, pond_store.STORE_DIR, "_appended"),
+                        os.path.join(rebuild, pond_store.STORE_DIR, "_appended"))
+        os.chdir(rebuild)
+        _reset()
+        rebuilt = _state()
+    finally:
+        os.chdir(cwd)
+        _reset()
+        shutil.rmtree(work, ignore_errors=True)
+        shutil.rmtree(rebuild, ignore_errors=True)
+
+    print(f"每个池塘 {n_points} 天的工作簿，追加 {days} 轮（每轮 3 个池塘各一天）")
+    print(f"首次全量同步              {t_sync * 1000:9.1f} ms")
+    print(f"单轮追加                  p50 {np.percentile(append_ms, 50):7.2f} ms  p95 {np.percentile(append_ms, 95):7.2f} ms")
+    diffs = _same(appended, rebuilt)
+    print(f"追加后的汇总与全量重建一致：{not diffs}")
+    for line in diffs[:20]:
+        print("  " + line)
+    return not diffs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=20)
+    args = parser.parse_args()
+    raise SystemExit(0 if run(args.points, args.days) else 1)
@@ -0,0 +1,61 @@
+"""
+登录页首屏耗时：立即导入 vs 按页面延迟导入
+
+每次测量都在新的解释器里进行（冷启动），从导入 streamlit 开始计时，
+到登录页脚本第一次运行结束（首屏内容全部产出）为止。
+
+用法（项目根目录）：
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 10 --app app_Version14.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ("pandas", "numpy", "requests", "pyarrow")
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.run()
+ms = (time.perf_counter() - t0) * 1000
+print(json.dumps({
+    "ms": ms,
+    "login": any(t.label == "账号名称" for t in at.text_input),
+    "errors": [str(e.value) for e in at.exception],
+    "loaded": [m for m in sys.argv[2].split(",") if m in sys.modules],
+}))
+"""
+
+
+def measure(app: str, eager: bool):
+    env = dict(os.environ, FISH_EAGER_IMPORTS="1" if eager else "0")
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, os.path.abspath(app), ",".join(HEAVY_MODULES)],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    if result["errors"] or not result["login"]:
+        raise RuntimeError(f"登录页未正常渲染：{result['errors']}")
+    return result
+
+
+def run(app: str, runs: int):
+    print(f"{'模式':<8} {'中位数(ms)':>10} {'最小(ms)':>10}  已加载的重型模块")
+    for label, eager in (("立即导入", True), ("延迟导入", False)):
+        results = [measure(app, eager) for _ in range(runs)]
+        times = [r["ms"] for r in results]
+        print(f"{label:<8} {statistics.median(times):>10.0f} {min(times):>10.0f}  {', '.join(results[-1]['loaded']) or '-'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", default="app_Version14.py")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    run(args.app, args.runs)
@@ -0,0 +1,59 @@
+"""
+检测吞吐量：进程内检测器 vs 1..N 个子进程的检测池
+
+每种配置处理同一批随机 1280×720 帧（含预处理与后处理），报告每秒帧数与相对单进程的加速比。
+需要 onnxruntime 与检测模型（默认 models/fish_disease.onnx，可用 --model 或 FISH_MODEL 指定）。
+
+用法（项目根目录）：
+    python -m benchmarks.bench_worker_pool
+    python -m benchmarks.bench_worker_pool --frames 400 --max-workers 8
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+import detector
+import worker_pool
+
+
+def _frames(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return [Image.fromarray(rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8)) for _ in range(n)]
+
+
+def _throughput(engine, images, conf: float):
+    engine.detect_many(images[:4], conf)            # 预热
+    t0 = time.perf_counter()
+    engine.detect_many(images, conf)
+    return len(images) / (time.perf_counter() - t0)
+
+
+def run(model: str, n_frames: int, max_workers: int, conf: float):
+    images = _frames(n_frames)
+    print(f"{'配置':<12} {'帧/秒':>8} {'加速比':>8}")
+    base = _throughput(detector.Detector(model), images, conf)
+    print(f"{'进程内':<12} {base:>8.1f} {1.0:>8.2f}")
+    workers = 1
+    while workers <= max_workers:
+        pool = worker_pool.DetectorPool(model, workers)
+        try:
+            fps = _throughput(pool, images, conf)
+        finally:
+            pool.close()
+        print(f"{f'{workers} 个进程':<12} {fps:>8.1f} {fps / base:>8.2f}")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=detector.MODEL_PATH)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--conf", type=float, default=0.7)
+    args = parser.parse_args()
+    if detector.ort is None:
+        raise SystemExit("未安装 onnxruntime")
+    run(args.model, args.frames, args.max_workers, args.conf)
@@ -0,0 +1,219 @@
+"""
+摄像头来源的实时检测流水线
+- 解码、预处理、推理各占一个线程，相邻阶段之间是只存最新一帧的槽位：
+  推理跟不上时旧帧直接被新帧覆盖（latest-frame-wins），延迟不会越积越大
+- 推理走检测器的共享微批队列，模型常驻进程内
+- 同一路网络摄像头（RTSP/HTTP）在进程内只开一条流水线，多个会话共享；
+  按会话登记查看者，最后一个查看者点停止、或长时间没人查看（如直接关掉页面）时才停止
+- 统计每帧从采集到出结果的延迟、输出帧率和各阶段丢帧数，叠加在画面左上角
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import numpy as np
+from PIL import Image
+
+import detector
+import video_analysis
+
+CAMERA_FPS = 10.0               # 网络摄像头的解码帧率上限
+IDLE_TIMEOUT = 60.0             # 超过这么久没人取结果就停止流水线（秒）
+CONNECT_TIMEOUT = 10.0          # 打开网络摄像头、读取视频流的超时（秒）
+INFER_TIMEOUT = 10.0            # 单帧推理结果的等待上限（秒），检测器重新加载后旧队列不会再出结果
+STATS_WINDOW = 2.0              # 帧率按最近多少秒统计
+
+_lock = threading.Lock()
+_pipelines = {}                 # 摄像头地址 -> LivePipeline
+
+
+class LatestSlot:
+    """只保留最新一项的槽位；put 覆盖旧值时计一次丢帧"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self._cond.notify()
+
+    def take(self, timeout: float = 0.5):
+        with self._cond:
+            if self._item is None:
+                self._cond.wait(timeout)
+            item, self._item = self._item, None
+            return item
+
+
+class LivePipeline:
+    def __init__(self, engine, conf: float, frames=None):
+        """frames 为 (时间, HxWx3 uint8) 的迭代器；为 None 时由调用方 push() 喂帧（浏览器摄像头）"""
+        self.engine = engine
+        self.conf = conf
+        self._raw, self._pre = LatestSlot(), LatestSlot()
+        self._stop = threading.Event()
+        self._result_lock = threading.Lock()
+        self._result = None                     # (帧, 检测结果, 延迟秒)
+        self._done = deque()                    # 最近出结果的时间，用于算帧率
+        self._latency = deque(maxlen=64)
+        self.error = None
+        self.last_seen = time.monotonic()
+        self.viewers = set()                    # 正在查看的会话，由 open_stream / close_stream 维护
+        stages = [self._preprocess, self._infer] + ([lambda: self._decode(frames)] if frames is not None else [])
+        self._threads = [threading.Thread(target=self._guard, args=(s,), daemon=True) for s in stages]
+        for t in self._threads:
+            t.start()
+
+    # ---------- 各阶段 ----------
+    def _guard(self, stage):
+        try:
+            stage()
+        except Exception as e:
+            self.error = str(e)
+            self._stop.set()
+
+    def _decode(self, frames):
+        for _, frame in frames:
+            if self._stop.is_set():
+                break
+            self.push(frame)
+        self._stop.set()
+
+    def push(self, frame: np.ndarray):
+        self._raw.put((time.perf_counter(), frame))
+
+    def _preprocess(self):
+        while not self._stop.is_set():
+            if time.monotonic() - self.last_seen > IDLE_TIMEOUT:
+                break                           # 没人再看了，释放摄像头与推理资源
+            item = self._raw.take()
+            if item is None:
+                continue
+            captured, frame = item
+            image = Image.fromarray(frame)
+            x, meta = self.engine.preprocess(image)
+            self._pre.put((captured, image, x, meta))
+        self._stop.set()
+
+    def _infer(self):
+        while not self._stop.is_set():
+            item = self._pre.take()
+            if item is None:
+                continue
+            captured, image, x, meta = item
+            try:
+                raw = self.engine.server.submit(x).result(timeout=INFER_TIMEOUT)
+            except FutureTimeout:
+                raise RuntimeError(f"推理 {INFER_TIMEOUT:g} 秒未返回结果，检测器可能已重新加载") from None
+            dets = self.engine.postprocess(raw, meta, image.size, self.conf)
+            now = time.perf_counter()
+            with self._result_lock:
+                self._result = (image, dets, now - captured)
+                self._latency.append(now - captured)
+                self._done.append(now)
+                while self._done and now - self._done[0] > STATS_WINDOW:
+                    self._done.popleft()
+
+    # ---------- 对外 ----------
+    def stats(self):
+        with self._result_lock:
+            latency = list(self._latency)
+            fps = (len(self._done) - 1) / (self._done[-1] - self._done[0]) if len(self._done) > 1 else 0.0
+        return {
+            "fps": fps,
+            "latency_ms": latency[-1] * 1000 if latency else 0.0,
+            "latency_p95_ms": float(np.percentile(latency, 95)) * 1000 if latency else 0.0,
+            "dropped": self._raw.dropped + self._pre.dropped,
+            "running": not self._stop.is_set(),
+        }
+
+    def latest(self):
+        """最新结果 (图片, 检测结果) 与统计；还没有结果时图片为 None"""
+        self.last_seen = time.monotonic()
+        with self._result_lock:
+            result = self._result
+        image, dets = (result[0], result[1]) if result else (None, [])
+        return image, dets, self.stats()
+
+    def stop(self):
+        self._stop.set()
+
+
+def overlay(image: Image.Image, detections, stats):
+    """检测框 + 左上角延迟 / 帧率"""
+    text = f"latency {stats['latency_ms']:.0f} ms | p95 {stats['latency_p95_ms']:.0f} ms | {stats['fps']:.1f} FPS"
+    return detector.draw(image, detections, caption=text)
+
+
+def _reap():
+    for url, p in list(_pipelines.items()):
+        if not p.stats()["running"]:
+            del _pipelines[url]
+
+
+def _reuse(url: str, engine, conf: float, viewer: str):
+    p = _pipelines.get(url)
+    if p is None or p.engine is not engine:
+        return None
+    p.conf = conf
+    p.last_seen = time.monotonic()
+    p.viewers.add(viewer)
+    return p
+
+
+def open_stream(url: str, engine, conf: float, viewer: str):
+    """viewer（会话标识）开始查看网络摄像头的共享流水线；置信度以最后一次打开时为准"""
+    with _lock:
+        _reap()
+        p = _reuse(url, engine, conf, viewer)
+    if p is not None:
+        return p
+    # 探测视频流要等网络，不能持锁：一个连不上的地址不该卡住其他会话
+    stream, _ = video_analysis.frames(url, CAMERA_FPS, timeout=CONNECT_TIMEOUT)
+    with _lock:
+        p = _reuse(url, engine, conf, viewer)   # 等待期间别的会话可能已经打开了
+        if p is None:
+            old = _pipelines.get(url)
+            if old is not None:
+                old.stop()
+            p = _pipelines[url] = LivePipeline(engine, conf, stream)
+            p.viewers.add(viewer)
+        return p
+
+
+def close_stream(url: str, viewer: str):
+    """viewer 不再查看；其他会话还在看时流水线继续运行"""
+    with _lock:
+        p = _pipelines.get(url)
+        if p is None:
+            return
+        p.viewers.discard(viewer)
+        if p.viewers:
+            return
+        del _pipelines[url]
+    p.stop()
+
+
+def get_stream(url: str):
+    with _lock:
+        return _pipelines.get(url)
+
+
+def webrtc_callback(pipeline: LivePipeline):
+    """streamlit-webrtc 的逐帧回调：新帧喂给流水线，返回叠加了最新检测结果的当前帧"""
+    import av
+
+    def callback(frame):
+        img = frame.to_ndarray(format="rgb24")
+        pipeline.push(img)
+        _, dets, stats = pipeline.latest()
+        out = overlay(Image.fromarray(img), dets, stats)
+        return av.VideoFrame.from_ndarray(np.asarray(out), format="rgb24")
+
+    return callback
@@ -0,0 +1,308 @@
+"""
+应用状态的嵌入式数据库（SQLite）
+- 论坛帖子、评论、问答对话记录、识别页的检测结果都存这里，刷新页面不丢失；帖子、评论和检测结果所有用户共享，
+  对话记录按页面生成的随机会话 id 分开
+- WAL 模式：读不阻塞写，多个会话线程可同时查询；写操作各自一个短事务
+- 连接池：每个连接开启时设置好 PRAGMA，脚本线程借用后归还，不再每次查询重新打开文件
+- SQL 都是下面的固定语句 + 参数绑定，sqlite3 按连接缓存编译好的语句（prepared statement），重复执行不再解析
+- 常用查询（最新 N 条、按热度取前几、按作者、按帖子取评论、未刷入的检测结果）都有对应索引，页面不再在 Python 里排序切片
+- 帖子的热门排序用时间衰减热度（ranking）：浏览、点赞、回复各在一条 UPDATE 里累加到该帖的对数分数，
+  hot 列上的索引直接给出前 K 名
+- 论坛列表用键集分页（feed）：游标是上一页最后一条的 (排序键, id)，下一页从索引上的该位置接着往后扫，
+  翻到多深都只读一页的行，不像 OFFSET 那样要先跳过前面所有行（百万帖子下的延迟见 benchmarks/bench_forum_feed.py）
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import ranking
+
+DB_PATH = os.getenv("FISH_DB", "app.db")
+POOL_SIZE = 4
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE = 64            # 每个连接缓存的已编译语句数
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    slug TEXT UNIQUE,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL DEFAULT '',
+    author TEXT NOT NULL,
+    pinned INTEGER NOT NULL DEFAULT 0,
+    heat INTEGER NOT NULL DEFAULT 0,    -- 累计互动次数（浏览 + 点赞 + 回复），只用于显示
+    created_at TEXT NOT NULL,
+    hot REAL NOT NULL DEFAULT 0         -- 时间衰减热度的对数分数，见 ranking
+);
+CREATE INDEX IF NOT EXISTS posts_created ON posts (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS posts_author ON posts (author, created_at DESC);
+
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY,
+    post_id INTEGER NOT NULL REFERENCES posts (id) ON DELETE CASCADE,
+    content TEXT NOT NULL,
+    author TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS comments_post ON comments (post_id, id DESC);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_session ON messages (session, id);
+
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    farm TEXT NOT NULL,
+    pond TEXT NOT NULL,
+    counts TEXT NOT NULL,           -- 各指标数量的 JSON
+    flushed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS detections_pending ON detections (flushed, id);
+CREATE INDEX IF NOT EXISTS detections_pond ON detections (farm, pond, ts);
+"""
+
+# 论坛的初始帖子（原先写死在页面里），首次建库时写入；slug 为 post1 的帖子有详情页
+SEED_POSTS = [
+    {"slug": "post1", "title": "乌鳢(黑鱼)养殖出现烂鳃病如何防治？", "heat": 42, "author": "云南黑鱼养殖户", "created_at": "2025-09-03 14:31:00"},
+    {"slug": "seed-2", "title": "稻田养鲫鱼如何防除敌害？", "heat": 29, "author": "广东鲫鱼养殖户", "created_at": "2025-08-02 18:24:00"},
+    {"slug": "seed-3", "title": "养泥鳅水质优劣如何观察及处理方法？", "heat": 21, "author": "湖北泥鳅养殖户", "created_at": "2025-09-20 10:49:00"},
+    {"slug": "seed-4", "title": "如何降低泥鳅的饲养成本？", "heat": 4, "author": "湖北泥鳅养殖户", "created_at": "2025-10-03 10:49:00"},
+    {"slug": "seed-5", "title": "怎么在鲟鱼水花开口期提高养殖收益？", "heat": 3, "author": "浙江鲟鱼养殖户", "created_at": "2025-10-02 15:22:00"},
+    {"slug": "seed-6", "title": "鲶鱼养殖如何增产？", "heat": 7, "author": "四川鲶鱼养殖户", "created_at": "2025-10-01 12:48:00"},
+]
+
+# =============== 语句 ===============
+POST_COLUMNS = "id, slug, title, content, author, pinned, heat, created_at, hot"
+SQL_INSERT_POST = (
+    "INSERT OR IGNORE INTO posts (slug, title, content, author, pinned, heat, created_at, hot) "
+    "VALUES (:slug, :title, :content, :author, :pinned, :heat, :created_at, :hot)"
+)
+SQL_HOT_INDEX = "CREATE INDEX IF NOT EXISTS posts_hot ON posts (hot DESC, id DESC)"
+SQL_POST_EVENT = "UPDATE posts SET hot = logaddexp2(hot, ?), heat = heat + 1 WHERE id = ?"
+# 键集分页：排序键与索引列一致。游标之后的行分两段各做一次索引定位——与游标同键、id 更小的，
+# 以及键更小的——再合并取一页；直接写 (键, id) < (?, ?) 时 SQLite 只按键定位，热度相同的大量帖子会被逐行扫过
+FEED_ORDERS = {"latest": "created_at", "hot": "hot"}
+SQL_FEED_FIRST = {
+    order: f"SELECT {POST_COLUMNS} FROM posts ORDER BY {col} DESC, id DESC LIMIT ?"
+    for order, col in FEED_ORDERS.items()
+}
+SQL_FEED_AFTER = {
+    order: (
+        f"SELECT * FROM (SELECT {POST_COLUMNS} FROM posts WHERE {col} = :key AND id < :id ORDER BY id DESC LIMIT :n) "
+        f"UNION ALL SELECT * FROM (SELECT {POST_COLUMNS} FROM posts WHERE {col} < :key ORDER BY {col} DESC, id DESC LIMIT :n) "
+        f"ORDER BY {col} DESC, id DESC LIMIT :n"
+    )
+    for order, col in FEED_ORDERS.items()
+}
+SQL_POSTS_BY_AUTHOR = f"SELECT {POST_COLUMNS} FROM posts WHERE author = ? ORDER BY created_at DESC LIMIT ?"
+SQL_POST_BY_SLUG = f"SELECT {POST_COLUMNS} FROM posts WHERE slug = ?"
+SQL_INSERT_COMMENT = "INSERT INTO comments (post_id, content, author, created_at) VALUES (?, ?, ?, ?)"
+SQL_COMMENTS = "SELECT id, content, author, created_at FROM comments WHERE post_id = ? ORDER BY id DESC LIMIT ?"
+SQL_INSERT_MESSAGE = "INSERT INTO messages (session, role, content, created_at) VALUES (?, ?, ?, ?)"
+SQL_MESSAGES = "SELECT role, content FROM messages WHERE session = ? ORDER BY id"
+SQL_CLEAR_MESSAGES = "DELETE FROM messages WHERE session = ?"
+SQL_INSERT_DETECTION = "INSERT INTO detections (ts, farm, pond, counts) VALUES (?, ?, ?, ?)"
+SQL_LAST_DETECTION_TS = "SELECT MAX(ts) FROM detections WHERE farm = ? AND pond = ?"
+SQL_PENDING_DETECTIONS = "SELECT id, ts, farm, pond, counts FROM detections WHERE flushed = 0 ORDER BY id"
+SQL_COUNT_PENDING = "SELECT COUNT(*), MIN(ts) FROM detections WHERE flushed = 0"
+SQL_MARK_FLUSHED = "UPDATE detections SET flushed = 1 WHERE flushed = 0 AND id <= ?"
+
+_lock = threading.Lock()
+_pool = None                    # 空闲连接队列，首次用到时建库并填满
+
+
+def now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")       # WAL 下每次提交只追加日志，检查点时才同步主文件
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.create_function("logaddexp2", 2, ranking.combine, deterministic=True)
+    return conn
+
+
+def _initial_hot(heat: int, created_at: str):
+    """发帖事件 + 已有的 heat 次互动都按发帖时间计入"""
+    when = datetime.strptime(created_at, "%Y-%m-%d %H:%M:%S")
+    score = ranking.point("post", when)
+    return ranking.combine(score, ranking.point("view", when, weight=heat)) if heat > 0 else score
+
+
+def _migrate(conn):
+    """早先建的库没有 hot 列：补上并按 heat 与发帖时间估算初始分数"""
+    columns = {r["name"] for r in conn.execute("PRAGMA table_info(posts)")}
+    if "hot" in columns:
+        return
+    with _transaction(conn):
+        conn.execute("ALTER TABLE posts ADD COLUMN hot REAL NOT NULL DEFAULT 0")
+        conn.execute("DROP INDEX IF EXISTS posts_heat")
+        rows = conn.execute("SELECT id, heat, created_at FROM posts").fetchall()
+        conn.executemany("UPDATE posts SET hot = ? WHERE id = ?",
+                         [(_initial_hot(r["heat"], r["created_at"]), r["id"]) for r in rows])
+
+
+def _init():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            return _pool
+        folder = os.path.dirname(DB_PATH)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = _connect()
+        conn.executescript(SCHEMA)
+        _migrate(conn)
+        conn.execute(SQL_HOT_INDEX)
+        with _transaction(conn):
+            conn.executemany(SQL_INSERT_POST, [
+                {"content": "", "pinned": 0, "hot": _initial_hot(p["heat"], p["created_at"]), **p} for p in SEED_POSTS
+            ])
+        pool = queue.Queue()
+        pool.put(conn)
+        for _ in range(POOL_SIZE - 1):
+            pool.put(_connect())
+        _pool = pool
+        return pool
+
+
+@contextmanager
+def _transaction(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+@contextmanager
+def connection():
+    """从连接池借一个连接；池空时等待其他线程归还"""
+    pool = _pool or _init()
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        pool.put(conn)
+
+
+def _query(sql: str, params=()):
+    with connection() as conn:
+        return [dict(r) for r in conn.execute(sql, params)]
+
+
+def _write(sql: str, params=()):
+    with connection() as conn, _transaction(conn):
+        return conn.execute(sql, params).lastrowid
+
+
+# =============== 论坛 ===============
+def add_post(title: str, content: str, author: str, pinned: bool = False):
+    return _write(SQL_INSERT_POST, {
+        "slug": None, "title": title, "content": content, "author": author,
+        "pinned": int(pinned), "heat": 0, "created_at": now(), "hot": ranking.point("post"),
+    })
+
+
+def record_event(post_id: int, kind: str, when: datetime = None):
+    """浏览（view）、点赞（like）、回复（reply）：增量更新该帖的热度"""
+    _write(SQL_POST_EVENT, (ranking.point(kind, when), post_id))
+
+
+def feed(order: str = "latest", cursor=None, limit: int = 10):
+    """
+    按发布时间（latest）或热度（hot）倒序的一页帖子。
+    cursor 为上一页返回的游标，首页传 None；返回 (帖子列表, 下一页游标)，没有更多时游标为 None
+    """
+    if cursor is None:
+        rows = _query(SQL_FEED_FIRST[order], (limit + 1,))
+    else:
+        rows = _query(SQL_FEED_AFTER[order], {"key": cursor[0], "id": cursor[1], "n": limit + 1})
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1][FEED_ORDERS[order]], rows[-1]["id"])
+
+
+def hot_posts(limit: int = 3):
+    return feed("hot", None, limit)[0]
+
+
+def posts_by_author(author: str, limit: int = 20):
+    return _query(SQL_POSTS_BY_AUTHOR, (author, limit))
+
+
+def get_post(slug: str):
+    rows = _query(SQL_POST_BY_SLUG, (slug,))
+    return rows[0] if rows else None
+
+
+def add_comment(post_id: int, content: str, author: str):
+    """发表评论，并在同一事务里给帖子记一次回复"""
+    with connection() as conn, _transaction(conn):
+        comment_id = conn.execute(SQL_INSERT_COMMENT, (post_id, content, author, now())).lastrowid
+        conn.execute(SQL_POST_EVENT, (ranking.point("reply"), post_id))
+    return comment_id
+
+
+def comments(post_id: int, limit: int = 10):
+    """最新的 limit 条评论，新的在前"""
+    return _query(SQL_COMMENTS, (post_id, limit))
+
+
+# =============== 问答对话 ===============
+def add_message(session: str, role: str, content: str):
+    return _write(SQL_INSERT_MESSAGE, (session, role, content, now()))
+
+
+def messages(session: str):
+    return _query(SQL_MESSAGES, (session,))
+
+
+def clear_messages(session: str):
+    _write(SQL_CLEAR_MESSAGES, (session,))
+
+
+# =============== 检测结果 ===============
+def add_detection(farm: str, pond: str, counts_json: str, when: datetime = None):
+    """
+    写入一条检测结果，返回 (id, 时间)。时间在写事务里取，并且严格晚于该池塘已有的最后一条：
+    同一池塘内时间顺序与 id（提交顺序）一致，刷入 pond_store 时按时间去重就等于按 id 去重，
+    等锁期间被别的记录抢先提交也不会得到更早的时间
+    """
+    with connection() as conn, _transaction(conn):
+        ts = when or datetime.now()
+        last = conn.execute(SQL_LAST_DETECTION_TS, (farm, pond)).fetchone()[0]
+        if last is not None:
+            ts = max(ts, datetime.fromisoformat(last) + timedelta(microseconds=1))
+        ts = ts.isoformat(timespec="microseconds")
+        return conn.execute(SQL_INSERT_DETECTION, (ts, farm, pond, counts_json)).lastrowid, ts
+
+
+def pending_detections():
+    return _query(SQL_PENDING_DETECTIONS)
+
+
+def pending_summary():
+    """(未刷入条数, 其中最早的时间)"""
+    with connection() as conn:
+        return tuple(conn.execute(SQL_COUNT_PENDING).fetchone())
+
+
+def mark_flushed(last_id: int):
+    _write(SQL_MARK_FLUSHED, (last_id,))
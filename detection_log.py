@@ -0,0 +1,71 @@
+"""
+检测结果写入数据查询页的时间序列
+- 每次识别（图片一批、视频一段）记一条：各类别数量、鱼类总数、患病总数（鱼类总数减健康），时间精确到微秒
+- 检测结果是一张照片里的鱼，不是池塘盘点：写进该池塘旁边单独的“<池塘>·识别”序列，不计入全部/养殖场汇总，
+  盘点数据（data.xlsx 与追加的逐日数据）的分布和患病总数趋势保持不变
+- 先插入应用数据库（db）的 detections 表：SQLite 的 WAL 提交只追加日志，识别页只付出一次小事务的开销，
+  检测历史也随数据库在所有用户之间共享
+- 未刷入的记录攒够 FLUSH_ROWS 条或最早一条超过 FLUSH_SECONDS 秒后，整批按池塘分组一次写进 pond_store
+  （每个池塘只改写一次受影响年份的分区，并增量更新汇总与 TrendIndex），随后标记为已刷入；
+  数据查询页每次打开前也会刷一次，看到的总是最新结果
+- 进程在写入 pond_store 后、标记之前退出时，下次会重放这些记录：pond_store.append 跳过不晚于已有最后时刻的行，重放不会重复计数。
+  记录的时间在插入事务里取，同一池塘严格递增且与 id 同序（见 db.add_detection），
+  所以按时间跳过的只会是已经写入过的行，不会丢掉晚提交、时间却更早的记录
+"""
+import json
+import threading
+
+import pandas as pd
+
+import db
+import fish_data
+import pond_store
+
+FLUSH_ROWS = 64
+FLUSH_SECONDS = 30.0
+SERIES_SUFFIX = "·识别"
+
+_lock = threading.Lock()
+
+
+def _counts_row(counts):
+    total = float(sum(counts.values()))
+    row = {fish_data.TOTAL_METRIC: total, fish_data.SICK_METRIC: total - float(counts.get("健康", 0))}
+    row.update({k: float(v) for k, v in counts.items()})
+    return row
+
+
+def series_pond(pond: str):
+    """检测结果在 pond_store 里的池塘名"""
+    return pond + SERIES_SUFFIX
+
+
+def record(counts, farm: str = fish_data.DEFAULT_FARM, pond: str = fish_data.DEFAULT_POND, when=None):
+    """记一次识别的各类别数量（detector.count_by_label 的结果）"""
+    db.add_detection(farm, pond, json.dumps(_counts_row(counts), ensure_ascii=False), when)
+    rows, oldest = db.pending_summary()
+    if rows >= FLUSH_ROWS or (pd.Timestamp.now() - pd.Timestamp(oldest)).total_seconds() >= FLUSH_SECONDS:
+        flush()
+
+
+def flush():
+    """把未刷入的记录整批写入 pond_store，返回写入的条数"""
+    with _lock:
+        entries = db.pending_detections()
+        if entries:
+            df = pd.DataFrame([
+                {"date": e["ts"], "farm": e["farm"], "pond": e["pond"], "metric": k, "value": v}
+                for e in entries for k, v in json.loads(e["counts"]).items()
+            ])
+            df["date"] = pd.to_datetime(df["date"])
+            pond_store.append({
+                (farm, series_pond(pond)): fish_data.finish_long(part.reset_index(drop=True), farm, series_pond(pond))
+                for (farm, pond), part in df.groupby(["farm", "pond"], sort=False)
+            }, rollup=False)
+            db.mark_flushed(entries[-1]["id"])
+        return len(entries)
+
+
+def pending():
+    """尚未刷入的条数"""
+    return db.pending_summary()[0]
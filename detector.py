@@ -0,0 +1,303 @@
+"""
+开始识别页的鱼病检测引擎
+- ONNX Runtime 在 CPU 上推理，模型每个进程只加载一次，加载后先空跑一次预热
+- 模型按 YOLOv8 导出格式约定：输入 (N, 3, S, S) 的 RGB 0~1，输出 (N, 4 + 类别数, 候选数)，
+  前 4 行为输入像素坐标下的 cx, cy, w, h，其余为各类别得分
+- 输入图片等比缩放并填充到 S×S（letterbox），检测框再映射回原图坐标
+- 所有会话的推理请求经同一个微批队列（batcher.BatchServer）合批执行，预处理与后处理留在各自的脚本线程
+- 后处理分两步：candidates() 取置信度下限（CONF_FLOOR）以上、NMS 之前的候选框，按得分降序存成数组；
+  select() 按当前阈值二分截取再做向量化 NMS。开始识别页缓存候选框，拖动置信度滑块只重跑 select()
+- 设置 FISH_WORKERS 后图片 / 视频识别改由多进程池（worker_pool）处理；高分辨率照片可改用分块检测（tiling）
+- 没有安装 onnxruntime 或找不到模型文件时 get_detector() 返回 None，页面给出提示
+"""
+import hashlib
+import os
+import threading
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+import batcher
+
+try:
+    import onnxruntime as ort
+except ImportError:             # 未安装时检测功能不可用，其他页面不受影响
+    ort = None
+
+MODEL_PATH = os.getenv("FISH_MODEL", os.path.join("models", "fish_disease.onnx"))
+WORKERS = int(os.getenv("FISH_WORKERS", "0"))  # 大于 0 时图片 / 视频识别分发到多进程池
+LABELS = ["健康", "眼部病变", "鳍部病变", "患溃疡病", "患腐烂鳃"]
+LABELS_ASCII = ["healthy", "eye", "fin", "ulcer", "gill-rot"]   # 没有中文字体时框上的标签
+COLORS = ["#16a34a", "#f59e0b", "#3b82f6", "#dc2626", "#7c3aed"]
+INPUT_SIZE = 640                # 模型输入为动态尺寸时使用
+CONF_FLOOR = 0.70               # 侧边栏置信度滑块的下限；缓存与会话里保存这一阈值以上的候选框
+IOU_THRESHOLD = 0.45
+MAX_CANDIDATES = 1000           # 每张图最多保留的候选框数（NMS 的 IoU 矩阵为其平方）
+PAD_VALUE = 114
+_FONT_CANDIDATES = ("NotoSansCJK-Regular.ttc", "wqy-microhei.ttc", "msyh.ttc", "simhei.ttf", "PingFang.ttc")
+
+_lock = threading.Lock()
+_state = {"detector": None, "key": None, "error": None}
+
+
+class Detector:
+    def __init__(self, path: str, threads: int = None, batching: bool = True, input_size: int = None, name: str = None):
+        """
+        threads 为推理线程数（默认用满全部核）；batching=False 时不启动微批队列（多进程池的子进程）。
+        input_size 只对动态输入尺寸的模型生效，用于较小分辨率的变体。
+        """
+        self.path = path
+        self.name = name or os.path.basename(path)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        opts.intra_op_num_threads = threads or os.cpu_count() or 1
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        h, w = inp.shape[2], inp.shape[3]
+        size = input_size or INPUT_SIZE
+        self.size = (h if isinstance(h, int) else size, w if isinstance(w, int) else size)
+        # 批维度固定的模型只能逐张推理
+        max_batch = inp.shape[0] if isinstance(inp.shape[0], int) else batcher.MAX_BATCH
+        with open(path, "rb") as f:
+            self.version = f"{hashlib.sha1(f.read()).hexdigest()[:12]}-{self.size[0]}"
+        self.warmup()
+        self.server = batcher.BatchServer(self.infer, max_batch=max_batch) if batching else None
+
+    def warmup(self):
+        """首次推理会触发内存分配与算子选择，加载时先空跑一次，避免第一位用户等待"""
+        self.infer(np.zeros((1, 3, *self.size), dtype=np.float32))
+
+    def preprocess(self, image: Image.Image):
+        """letterbox 到模型输入尺寸，返回 (CHW float32, (缩放比例, 左填充, 上填充))"""
+        image = image.convert("RGB")
+        th, tw = self.size
+        scale = min(tw / image.width, th / image.height)
+        nw, nh = max(1, round(image.width * scale)), max(1, round(image.height * scale))
+        left, top = (tw - nw) // 2, (th - nh) // 2
+        canvas = Image.new("RGB", (tw, th), (PAD_VALUE,) * 3)
+        canvas.paste(image.resize((nw, nh), Image.BILINEAR), (left, top))
+        x = np.asarray(canvas, dtype=np.float32).transpose(2, 0, 1) / 255.0
+        return x, (scale, left, top)
+
+    def infer(self, batch: np.ndarray):
+        """(N, 3, H, W) -> (N, 候选数, 4 + 类别数)"""
+        out = self.session.run(None, {self.input_name: batch})[0]
+        if out.shape[1] == 4 + len(LABELS):
+            out = out.transpose(0, 2, 1)
+        return out
+
+    def candidates(self, raw: np.ndarray, meta, size, floor: float = CONF_FLOOR):
+        """
+        单张图的模型输出 -> 得分不低于 floor 的候选框（原图坐标，NMS 之前），按得分降序：
+        {"boxes": (n, 4) float32, "scores": (n,) float32, "class_ids": (n,) int16}
+        """
+        scores = raw[:, 4:]
+        cls = scores.argmax(1)
+        score = scores[np.arange(len(cls)), cls]
+        idx = np.flatnonzero(score >= floor)
+        idx = idx[np.argsort(-score[idx], kind="stable")[:MAX_CANDIDATES]]
+        boxes = _xywh_to_xyxy(raw[idx, :4])
+
+        scale, left, top = meta
+        boxes = (boxes - [left, top, left, top]) / scale
+        boxes = boxes.clip(0, [size[0], size[1], size[0], size[1]])
+        return {
+            "boxes": boxes.astype(np.float32),
+            "scores": score[idx].astype(np.float32),
+            "class_ids": cls[idx].astype(np.int16),
+        }
+
+    def postprocess(self, raw: np.ndarray, meta, size, conf: float, iou: float = IOU_THRESHOLD):
+        """单张图的模型输出 -> 检测结果列表（原图坐标），按得分降序"""
+        return select(self.candidates(raw, meta, size, conf), conf, iou)
+
+    def detect(self, image: Image.Image, conf: float):
+        return self.detect_many([image], conf)[0]
+
+    def candidates_many(self, images, floor: float = CONF_FLOOR):
+        """一次提交多张图片，它们与其他会话的请求一起合批推理；返回各图的候选框"""
+        pending = []
+        for image in images:
+            x, meta = self.preprocess(image)
+            pending.append((self.server.submit(x), meta, image.size))
+        return [self.candidates(fut.result(), meta, size, floor) for fut, meta, size in pending]
+
+    def detect_many(self, images, conf: float):
+        return [select(c, conf) for c in self.candidates_many(images, conf)]
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+
+def _xywh_to_xyxy(b: np.ndarray):
+    out = np.empty_like(b)
+    out[:, :2] = b[:, :2] - b[:, 2:4] / 2
+    out[:, 2:] = b[:, :2] + b[:, 2:4] / 2
+    return out
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, iou: float):
+    """按类别做非极大值抑制，返回保留下标（得分降序）"""
+    if not len(boxes):
+        return np.empty(0, dtype=np.int64)
+    order = np.argsort(-scores, kind="stable")
+    b, c = boxes[order], classes[order]
+    # 一次算出两两 IoU；只有同类别、且得分更高的框才能抑制后面的框
+    x0 = np.maximum(b[:, None, 0], b[None, :, 0])
+    y0 = np.maximum(b[:, None, 1], b[None, :, 1])
+    x1 = np.minimum(b[:, None, 2], b[None, :, 2])
+    y1 = np.minimum(b[:, None, 3], b[None, :, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    over = inter / (area[:, None] + area[None, :] - inter + 1e-9) > iou
+    over &= c[:, None] == c[None, :]
+    over = np.triu(over, 1)
+    keep = np.ones(len(b), dtype=bool)
+    for i in range(len(b)):
+        if keep[i]:
+            keep &= ~over[i]
+    return order[keep]
+
+
+def select(cands, conf: float, iou: float = IOU_THRESHOLD):
+    """
+    候选框（candidates() 的结果）-> 当前阈值下的检测结果列表。
+    候选框按得分降序，阈值截取就是一次二分查找；截取后的几十到几百个框做向量化 NMS，耗时在毫秒以内
+    """
+    n = int(np.searchsorted(-cands["scores"], -conf, side="right"))
+    boxes, scores, classes = cands["boxes"][:n], cands["scores"][:n], cands["class_ids"][:n]
+    keep = nms(boxes, scores, classes, iou)
+    return [
+        {"label": LABELS[c], "class_id": int(c), "score": float(s), "box": [float(v) for v in b]}
+        for b, s, c in zip(boxes[keep], scores[keep], classes[keep])
+    ]
+
+
+def _model_choice():
+    """(模型路径, 输入尺寸, 变体名)；有变体测评结果时按延迟预算挑选，否则直接用 MODEL_PATH"""
+    import model_variants
+
+    v = model_variants.select()
+    if v is not None:
+        return v["path"], v["input_size"], v["name"]
+    return MODEL_PATH, None, None
+
+
+def get_detector():
+    """进程内共享的检测器；模型文件或所选变体变化后自动重新加载。不可用时返回 None"""
+    if ort is None:
+        return None
+    path, size, name = _model_choice()
+    try:
+        s = os.stat(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), s.st_mtime_ns, s.st_size, size)
+    with _lock:
+        if _state["key"] != key:
+            if _state["detector"] is not None:
+                _state["detector"].close()
+            try:
+                _state.update(detector=Detector(path, input_size=size, name=name), key=key, error=None)
+            except Exception as e:          # 模型损坏或与约定格式不符
+                _state.update(detector=None, key=key, error=str(e))
+        return _state["detector"]
+
+
+def get_engine():
+    """
+    图片 / 视频识别用的引擎：配置了 FISH_WORKERS 时为多进程池，否则为进程内检测器。
+    两者都提供 detect / detect_many；摄像头流水线对延迟敏感，始终用进程内检测器。
+    """
+    engine = get_detector()
+    if engine is None or WORKERS <= 0:
+        return engine
+    import worker_pool
+    return worker_pool.get_pool(engine.path, WORKERS, engine.version, engine.size[0])
+
+
+def unavailable_reason():
+    """get_detector() 返回 None 的原因；检查的是实际要加载的文件（按延迟预算选中的变体或 MODEL_PATH）"""
+    if ort is None:
+        return "未安装 onnxruntime，请先执行 pip install onnxruntime。"
+    path, _, name = _model_choice()
+    if not os.path.exists(path):
+        if name is not None:
+            return f"未找到所选模型变体 {name} 的文件 {path}，请重新执行 python -m model_variants build / bench。"
+        return f"未找到检测模型 {path}，请将导出的 ONNX 模型放到该位置（或设置环境变量 FISH_MODEL）。"
+    if _state["error"]:
+        return f"检测模型加载失败：{_state['error']}"
+    return "检测模型暂不可用，请稍后重试。"
+
+
+def analyze(engine, frames, digests, tiled: bool = False):
+    """
+    每张图在 CONF_FLOOR 以上的候选框，先查结果缓存，只对未命中的图片推理。
+    frames / digests 是 tiling.spill() 返回的内存映射与像素哈希，整图只在推理的那一批里临时解出。
+    tiled=True 时大图改用分块检测（tiling），结果按不同的版本号缓存。
+    返回 (候选框列表, 命中缓存的张数)；页面再用 select() 按当前阈值出结果
+    """
+    import result_cache
+    import tiling
+
+    split = [tiled and tiling.needed(f, engine.size[0]) for f in frames]
+    versions = [engine.version + ("-tiled" if t else "") for t in split]
+    found = [result_cache.get(d, v) for d, v in zip(digests, versions)]
+    misses = [i for i, v in enumerate(found) if v is None]
+    whole = [i for i in misses if not split[i]]
+    for k in range(0, len(whole), batcher.MAX_BATCH):
+        chunk = whole[k:k + batcher.MAX_BATCH]
+        for i, cands in zip(chunk, engine.candidates_many([Image.fromarray(np.asarray(frames[i])) for i in chunk], CONF_FLOOR)):
+            found[i] = cands
+    for i in misses:
+        if split[i]:
+            found[i] = tiling.candidates(engine, frames[i], CONF_FLOOR)
+    for i in misses:
+        result_cache.put(digests[i], versions[i], found[i])
+    return found, len(frames) - len(misses)
+
+
+def count_by_label(detections):
+    counts = {label: 0 for label in LABELS}
+    for d in detections:
+        counts[d["label"]] += 1
+    return counts
+
+
+def _font(size: int):
+    for name in _FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, size), True
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size), False
+    except TypeError:           # Pillow < 10.1 的默认字体不支持指定字号
+        return ImageFont.load_default(), False
+
+
+def draw(image: Image.Image, detections, caption: str = None, scale: float = 1.0):
+    """
+    在图片副本上画出检测框与标签；caption 写在左上角（如实时画面的延迟与帧率）。
+    image 是缩小的预览图时，scale = 预览宽 / 原图宽，框坐标按它换算
+    """
+    out = image.convert("RGB")
+    canvas = ImageDraw.Draw(out)
+    width = max(2, round(max(out.size) / 400))
+    font, cjk = _font(max(14, width * 8))
+    if caption:
+        x0, y0, x1, y1 = canvas.textbbox((2 * width, 2 * width), caption, font=font)
+        canvas.rectangle((x0 - width, y0 - width, x1 + width, y1 + width), fill="black")
+        canvas.text((2 * width, 2 * width), caption, fill="white", font=font)
+    for d in detections:
+        color = COLORS[d["class_id"]]
+        x0, y0, x1, y1 = (v * scale for v in d["box"])
+        canvas.rectangle((x0, y0, x1, y1), outline=color, width=width)
+        text = f"{(LABELS if cjk else LABELS_ASCII)[d['class_id']]} {d['score']:.2f}"
+        tx0, ty0, tx1, ty1 = canvas.textbbox((x0, y0), text, font=font)
+        ty = max(0, y0 - (ty1 - ty0) - 2 * width)
+        canvas.rectangle((x0, ty, x0 + (tx1 - tx0) + 2 * width, ty + (ty1 - ty0) + 2 * width), fill=color)
+        canvas.text((x0 + width, ty + width - (ty0 - y0)), text, fill="white", font=font)
+    return out
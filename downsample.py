@@ -0,0 +1,64 @@
+"""
+趋势折线图的服务端降采样
+- lttb: Largest-Triangle-Three-Buckets，保留视觉形状
+- minmax: 每个桶保留最小值和最大值，保证尖峰不丢
+点数按图表像素宽度给定预算，数据点不超过预算时原样返回
+"""
+import numpy as np
+import pandas as pd
+
+PIXEL_BUDGET = 1000     # 折线图大致的像素宽度
+
+
+def _as_float(x: np.ndarray):
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int):
+    """返回 LTTB 选中点的下标（含首尾两点）"""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    xf, yf = _as_float(x), y.astype(np.float64)
+    # 首尾各占一个点，中间 n-2 个点均分到 n_out-2 个桶
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 下一个桶的平均点作为第三个顶点
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        cx, cy = xf[nlo:nhi].mean(), yf[nlo:nhi].mean()
+        ax, ay = xf[a], yf[a]
+        area = np.abs((ax - cx) * (yf[lo:hi] - ay) - (ax - xf[lo:hi]) * (cy - ay))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+def minmax_indices(y: np.ndarray, n_out: int):
+    """每个桶取最小、最大值两点（按原顺序），共约 n_out 个点"""
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    n_buckets = (n_out - 2) // 2                # 留两个点给首尾
+    starts = np.linspace(0, n, n_buckets + 1).astype(np.int64)[:-1]
+    bucket = np.repeat(np.arange(n_buckets), np.diff(np.append(starts, n)))
+    order = np.lexsort((y, bucket))             # 桶内按值排序
+    first = np.searchsorted(bucket[order], np.arange(n_buckets), side="left")
+    last = np.searchsorted(bucket[order], np.arange(n_buckets), side="right") - 1
+    return np.unique(np.concatenate([order[first], order[last], [0, n - 1]]))
+
+
+def downsample(series: pd.Series, budget: int = PIXEL_BUDGET, method: str = "lttb"):
+    """对日期索引的序列降采样到不超过 budget 个点"""
+    if len(series) <= budget:
+        return series
+    if method == "minmax":
+        idx = minmax_indices(series.to_numpy(), budget)
+    else:
+        idx = lttb_indices(series.index.to_numpy(), series.to_numpy(), budget)
+    return series.iloc[idx]
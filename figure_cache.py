@@ -0,0 +1,53 @@
+"""
+数据查询页图表的跨会话缓存
+- 键：数据版本 + 图表名 + 图表参数；值：序列化后的 plotly / Vega-Lite JSON
+- 所有会话共用一份，按总字节数做 LRU 淘汰
+- 数据版本变化时旧版本的图表全部作废
+"""
+import threading
+from collections import OrderedDict
+
+MAX_BYTES = 64 * 1024 * 1024     # 缓存的 JSON 总大小上限
+
+_lock = threading.Lock()
+_cache = OrderedDict()           # (版本, 图表名, 参数) -> JSON 字符串
+_state = {"version": None, "bytes": 0, "hits": 0, "misses": 0}
+
+
+def _evict_to(limit: int):
+    while _cache and _state["bytes"] > limit:
+        _, spec = _cache.popitem(last=False)
+        _state["bytes"] -= len(spec)
+
+
+def get_spec(version, chart: str, params: tuple, build):
+    """
+    取缓存的图表 JSON；未命中时调用 build() 生成（返回 JSON 字符串）。
+    build 在锁外执行，多个会话同时未命中时可能各自生成一次，结果相同，不影响正确性。
+    """
+    key = (version, chart, params)
+    with _lock:
+        if version != _state["version"]:
+            _cache.clear()
+            _state.update(version=version, bytes=0)
+        if key in _cache:
+            _cache.move_to_end(key)
+            _state["hits"] += 1
+            return _cache[key]
+        _state["misses"] += 1
+
+    spec = build()
+    with _lock:
+        if version == _state["version"] and key not in _cache and len(spec) <= MAX_BYTES:
+            _cache[key] = spec
+            _state["bytes"] += len(spec)
+            _evict_to(MAX_BYTES)
+    return spec
+
+
+def cache_info():
+    with _lock:
+        return {
+            "hits": _state["hits"], "misses": _state["misses"],
+            "entries": len(_cache), "bytes": _state["bytes"],
+        }
@@ -0,0 +1,327 @@
+"""
+数据查询页的数据加载层
+- data.xlsx 只解析一次，清洗成长表 (date, metric, value, farm, pond)，以日期为索引
+- 分布、趋势等都是对长表的向量化查询，不再逐次扫描首列字符串
+- 以 (mtime, size) 作快速判断，内容 sha1 作最终缓存键
+- 进程内有界 LRU，所有会话共享，并记录命中/未命中次数
+- 首次解析后写出列式 Feather 旁路文件，之后内存映射读取，源文件更新时才回退到 Excel
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:             # 没有 pyarrow 时只用 Excel + 内存缓存
+    pa = None
+
+DATA_PATH = "data.xlsx"
+CACHE_MAX_ENTRIES = 8           # LRU 最多保留的工作簿数
+SIDECAR_DIR = ".data_cache"     # 旁路文件目录（相对工作簿所在目录）
+SIDECAR_FORMAT = "2"
+
+TOTAL_METRIC = "鱼类总数"
+SICK_METRIC = "患病总数"
+NON_CATEGORY_COLS = (TOTAL_METRIC, "时间", SICK_METRIC)
+DEFAULT_FARM = "默认养殖场"
+DEFAULT_POND = "1号池"
+LONG_COLUMNS = ["metric", "value", "farm", "pond"]
+
+_lock = threading.Lock()
+_cache = OrderedDict()          # sha1 -> 解析结果
+_file_index = {}                # 绝对路径 -> (mtime_ns, size, sha1)
+_stats = {"hits": 0, "misses": 0}
+
+
+def _file_sha1(path: str):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def normalize_frame(df: pd.DataFrame, farm: str = DEFAULT_FARM, pond: str = DEFAULT_POND):
+    """
+    把 read_excel 得到的原始表清洗成长表：
+    - 第 0 行的鱼类总数及各类别数量作为一次快照，日期取趋势的最后一天（无趋势时取今天）
+    - “时间/患病总数”行展开为患病总数指标的逐日记录
+    """
+    df = df.copy()
+    df.columns = [str(c).strip() for c in df.columns]
+
+    category_cols = [
+        c for c in df.columns
+        if (not str(c).startswith("Unnamed")) and c not in NON_CATEGORY_COLS
+    ]
+    snap_values = pd.to_numeric(df.loc[0, category_cols], errors="coerce").fillna(0)
+    snap_metrics = list(category_cols)
+    if TOTAL_METRIC in df.columns:
+        total_val = pd.to_numeric(df.loc[0, TOTAL_METRIC], errors="coerce")
+        if pd.notna(total_val) and total_val > 0:     # 缺失时查询阶段用各类别之和
+            snap_metrics.insert(0, TOTAL_METRIC)
+            snap_values = pd.concat([pd.Series([total_val]), snap_values], ignore_index=True)
+
+    trend = _parse_trend(df)
+    has_trend = trend is not None and len(trend) > 0
+    snap_date = trend["时间"].max() if has_trend else pd.Timestamp.today().normalize()
+
+    parts = [pd.DataFrame({
+        "date": snap_date,
+        "metric": snap_metrics,
+        "value": snap_values.to_numpy(dtype="float64"),
+    })]
+    if has_trend:
+        parts.append(pd.DataFrame({
+            "date": trend["时间"].to_numpy(),
+            "metric": SICK_METRIC,
+            "value": trend["患病鱼总数"].to_numpy(dtype="float64"),
+        }))
+    return finish_long(pd.concat(parts, ignore_index=True), farm, pond)
+
+
+def finish_long(long_df: pd.DataFrame, farm: str = None, pond: str = None):
+    """统一长表的类型：日期索引升序，metric/farm/pond 为分类类型，value 为 float64"""
+    long_df = long_df.copy()
+    if farm is not None:
+        long_df["farm"] = farm
+    if pond is not None:
+        long_df["pond"] = pond
+    long_df["date"] = pd.to_datetime(long_df["date"]).astype("datetime64[ns]")
+    long_df["value"] = long_df["value"].astype("float64")
+    for col in ("metric", "farm", "pond"):
+        long_df[col] = long_df[col].astype("category")
+    long_df = long_df.sort_values("date", kind="mergesort").set_index("date")
+    return long_df[LONG_COLUMNS]
+
+
+# =============== 长表查询 ===============
+def metric_series(long_df: pd.DataFrame, metric: str, start=None, end=None):
+    """某指标在 [start, end] 内的取值序列（日期索引）"""
+    s = long_df.loc[long_df["metric"].to_numpy() == metric, "value"]
+    if start is not None or end is not None:
+        s = s.loc[start:end]
+    return s
+
+
+def distribution(long_df: pd.DataFrame):
+    """
+    最近一次快照的类别分布，返回 (类别/数量/占比(%) 表, 鱼类总数)。
+    - 每个类别取它最近一次的数量：追加的行只带部分类别时，其余类别沿用之前的值（与鱼类总数一样）
+    - 鱼类总数缺失时用各类别之和
+    """
+    metric = long_df["metric"].to_numpy()
+    snap = long_df[(metric != SICK_METRIC) & (metric != TOTAL_METRIC)]
+    # 长表按日期升序，groupby(sort=False) 保留类别首次出现的顺序
+    latest = pd.Series(snap["value"].to_numpy(), index=snap["metric"].astype(str).to_numpy()).groupby(level=0, sort=False).last()
+    totals = metric_series(long_df, TOTAL_METRIC)
+    counts = latest.to_numpy()
+    total_val = float(totals.iloc[-1]) if len(totals) else float(counts.sum())
+    dist = pd.DataFrame({
+        "类别": latest.index.to_numpy(),
+        "数量": counts.astype(int),
+        "占比(%)": (counts / total_val * 100).round(2) if total_val else np.zeros(len(counts))
+    })
+    return dist, total_val
+
+
+def _parse_trend(df: pd.DataFrame):
+    """
+    首列为“时间”“患病总数”的两行构成趋势序列。
+    Excel 单行最多 16384 列，更长的序列按多组“时间/患病总数”行续写，按出现顺序拼接。
+    """
+    first_col = df.columns[0]
+    first_vals = df[first_col].astype(str)
+    time_row_idx = df.index[first_vals.str.contains("时间", na=False)]
+    sick_row_idx = df.index[first_vals.str.contains("患病总数", na=False)]
+    if not len(time_row_idx) or not len(sick_row_idx):
+        return None
+
+    time_parts, sick_parts = [], []
+    for t_idx, s_idx in zip(time_row_idx, sick_row_idx):
+        t = pd.Series(df.iloc[df.index.get_loc(t_idx), 1:]).replace("None", np.nan).dropna()
+        v = pd.Series(df.iloc[df.index.get_loc(s_idx), 1:]).replace("None", np.nan)
+        v = pd.to_numeric(v, errors="coerce").dropna()
+        n = min(len(t), len(v))
+        time_parts.append(t.iloc[:n])
+        sick_parts.append(v.iloc[:n])
+    time_row = pd.concat(time_parts, ignore_index=True)
+    sick_row = pd.concat(sick_parts, ignore_index=True)
+
+    min_len = min(len(time_row), len(sick_row))
+    time_row = time_row.iloc[:min_len]
+    sick_row = sick_row.iloc[:min_len]
+
+    # Excel 日期序列号优先，失败再按字符串解析
+    time_num = pd.to_numeric(time_row, errors="coerce")
+    time_dt = pd.to_datetime(time_num, unit="D", origin="1899-12-30", errors="coerce")
+    if time_dt.isna().any():
+        time_dt = pd.to_datetime(time_row.astype(str), errors="coerce")
+
+    return pd.DataFrame({
+        "时间": time_dt.to_numpy(),
+        "患病鱼总数": sick_row.to_numpy()
+    }).dropna().reset_index(drop=True)
+
+
+# =============== 追加数据 ===============
+ROW_DATE_COLS = ("日期", "时间", "date")
+ROW_ENTITY_COLS = ("养殖场", "池塘")
+
+
+def parse_rows(src, filename: str, farm: str = DEFAULT_FARM, pond: str = DEFAULT_POND):
+    """
+    解析追加的逐日数据（CSV / XLSX / JSON 记录数组），每行一天：
+    日期（或时间）列 + 若干指标列（患病总数、各类别、鱼类总数）；
+    可带 养殖场/池塘 列，否则记到 farm/pond 下。返回 {(养殖场, 池塘): 长表}
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".csv":
+        df = pd.read_csv(src)
+    elif ext in (".xlsx", ".xls"):
+        df = pd.read_excel(src)
+    elif ext == ".json":
+        df = pd.read_json(src, orient="records")
+    else:
+        raise ValueError(f"不支持的文件类型：{ext}（仅支持 csv / xlsx / json）")
+
+    df.columns = [str(c).strip() for c in df.columns]
+    date_col = next((c for c in ROW_DATE_COLS if c in df.columns), None)
+    if date_col is None:
+        raise ValueError("缺少“日期”或“时间”列")
+    metric_cols = [
+        c for c in df.columns
+        if c != date_col and c not in ROW_ENTITY_COLS and not c.startswith("Unnamed")
+    ]
+    if not metric_cols:
+        raise ValueError("没有可追加的指标列（如“患病总数”）")
+
+    df = df.assign(
+        date=pd.to_datetime(df[date_col], errors="coerce"),
+        farm=df["养殖场"].astype(str) if "养殖场" in df.columns else farm,
+        pond=df["池塘"].astype(str) if "池塘" in df.columns else pond,
+    )
+    long_df = df.melt(id_vars=["date", "farm", "pond"], value_vars=metric_cols, var_name="metric", value_name="value")
+    long_df["value"] = pd.to_numeric(long_df["value"], errors="coerce")
+    long_df = long_df.dropna(subset=["date", "value"])
+    if not len(long_df):
+        raise ValueError(f"没有可追加的行：“{date_col}”列无法解析为日期，或指标值都为空")
+    return {
+        (f, p): finish_long(part.reset_index(drop=True))
+        for (f, p), part in long_df.groupby(["farm", "pond"], sort=False)
+    }
+
+
+# =============== 列式旁路文件 ===============
+def _sidecar_path(abs_path: str):
+    folder, name = os.path.split(abs_path)
+    return os.path.join(folder, SIDECAR_DIR, name + ".feather")
+
+
+def _sidecar_meta(path: str):
+    """只读 Arrow schema 上的元数据，不加载数据列"""
+    with pa.memory_map(path, "r") as source:
+        raw = pa.ipc.open_file(source).schema.metadata or {}
+    return {k.decode(): v.decode() for k, v in raw.items() if not k.startswith(b"pandas")}
+
+
+def _sidecar_digest(abs_path: str, st_):
+    """旁路文件记录的源文件 mtime/size 与当前一致时，直接复用其中的 sha1，省去重新哈希"""
+    if pa is None:
+        return None
+    path = _sidecar_path(abs_path)
+    try:
+        meta = _sidecar_meta(path)
+    except (OSError, pa.ArrowInvalid):
+        return None
+    if meta.get("format") != SIDECAR_FORMAT:
+        return None
+    if int(meta.get("source_mtime_ns", -1)) != st_.st_mtime_ns or int(meta.get("source_size", -1)) != st_.st_size:
+        return None     # 源文件在生成旁路文件之后被改过
+    return meta.get("source_sha1")
+
+
+def _read_sidecar(abs_path: str, digest: str):
+    if pa is None:
+        return None
+    path = _sidecar_path(abs_path)
+    try:
+        meta = _sidecar_meta(path)
+        if meta.get("format") != SIDECAR_FORMAT or meta.get("source_sha1") != digest:
+            return None
+        return {"long": feather.read_table(path, memory_map=True).to_pandas()}
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+
+def _write_sidecar(abs_path: str, st_, digest: str, data):
+    if pa is None:
+        return
+    path = _sidecar_path(abs_path)
+    table = pa.Table.from_pandas(data["long"], preserve_index=True)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        "format": SIDECAR_FORMAT,
+        "source_mtime_ns": str(st_.st_mtime_ns),
+        "source_size": str(st_.st_size),
+        "source_sha1": digest,
+    })
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        # 不压缩，读取时才能真正内存映射
+        feather.write_feather(table, tmp, compression="uncompressed")
+        os.replace(tmp, path)
+    except OSError:
+        pass            # 只读目录等情况下仅用内存缓存
+
+
+def load_workbook(path: str = DATA_PATH):
+    """
+    读取并清洗工作簿，返回 {"long": 长表, "version": sha1}，结果在所有会话间共享（调用方请勿原地修改）。
+    文件 mtime/size 未变直接命中；变了则重新算 sha1，内容相同仍算命中。
+    内存未命中时优先内存映射读取 Feather 旁路文件，源文件更新过才重新解析 Excel。
+    """
+    abs_path = os.path.abspath(path)
+    st_ = os.stat(abs_path)
+    with _lock:
+        known = _file_index.get(abs_path)
+        if known and known[:2] == (st_.st_mtime_ns, st_.st_size):
+            digest = known[2]
+        else:
+            digest = _sidecar_digest(abs_path, st_) or _file_sha1(abs_path)
+            _file_index[abs_path] = (st_.st_mtime_ns, st_.st_size, digest)
+
+        if digest in _cache:
+            _cache.move_to_end(digest)
+            _stats["hits"] += 1
+            return _cache[digest]
+
+        _stats["misses"] += 1
+        data = _read_sidecar(abs_path, digest)
+        if data is None:
+            data = {"long": normalize_frame(pd.read_excel(abs_path))}
+            _write_sidecar(abs_path, st_, digest, data)
+        data["version"] = digest
+        _cache[digest] = data
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+        return data
+
+
+def cache_info():
+    """返回命中/未命中次数与当前缓存条目数"""
+    with _lock:
+        return {"hits": _stats["hits"], "misses": _stats["misses"], "entries": len(_cache)}
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+        _file_index.clear()
+        _stats["hits"] = _stats["misses"] = 0
@@ -0,0 +1,36 @@
+"""
+按页面延迟导入重型依赖
+lazy("pandas") 返回模块代理，第一次访问其属性时才真正 import；
+登录页、论坛等用不到 pandas / numpy / requests 的页面就不再为它们付出导入时间。
+设置环境变量 FISH_EAGER_IMPORTS=1 可恢复立即导入（用于启动耗时对比）。
+"""
+import importlib
+import os
+
+EAGER = os.getenv("FISH_EAGER_IMPORTS") == "1"
+
+
+class LazyModule:
+    __slots__ = ("_name", "_module")
+
+    def __init__(self, name: str):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+
+    def _load(self):
+        if self._module is None:
+            object.__setattr__(self, "_module", importlib.import_module(self._name))
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "已加载" if self._module is not None else "未加载"
+        return f"<LazyModule {self._name} ({state})>"
+
+
+def lazy(name: str):
+    if EAGER:
+        return importlib.import_module(name)
+    return LazyModule(name)
@@ -0,0 +1,217 @@
+"""
+欢迎页 / 培训视频的转码与分发
+- 用本机 ffmpeg 预先转成多档码率的 HLS（fMP4 分片）、一个 faststart 的 MP4 回退版本和一张封面图
+- 产物写到 static/media/<名称>-<内容哈希>/，由 Streamlit 静态服务直接下发（支持 Range 请求），
+  不再经过会话的媒体处理器
+- 页面上是 <video preload="none" poster=...>：首屏只加载封面，点播放后才开始拉视频
+- 没转码好（或没有 ffmpeg）时返回 None，调用方回退到 st.video
+
+预先转码（项目根目录）：
+    python -m media video-2.mp4 video.mp4
+"""
+import argparse
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+
+from assets import static_enabled
+
+FFMPEG = os.getenv("FISH_FFMPEG", "ffmpeg")
+STATIC_DIR = "static"
+MEDIA_SUBDIR = "media"
+MANIFEST = "manifest.json"
+SEGMENT_SECONDS = 4
+# (高度, 视频码率 kbps)；高于源视频的档位会被去掉，最高一档按源高度截断
+LADDER = ((360, 600), (540, 1200), (720, 2400), (1080, 4500))
+FALLBACK_HEIGHT = 540           # 不支持 HLS 的浏览器播放的 MP4 回退档
+AUDIO_KBPS = 96
+POSTER_AT = 1.0                 # 封面取第几秒的画面
+
+# 静态服务按 mimetypes 猜 Content-Type；HLS 的类型不在所有 Python / 系统 mime.types 里
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/iso.segment", ".m4s")
+mimetypes.add_type("video/mp4", ".mp4")
+
+_lock = threading.Lock()
+_jobs = {}                      # 输出目录 -> 后台转码线程
+_digests = {}                   # (绝对路径, mtime_ns, size) -> 内容 sha1
+
+
+def ffmpeg_available():
+    return shutil.which(FFMPEG) is not None
+
+
+def _digest(path: str):
+    s = os.stat(path)
+    key = (os.path.abspath(path), s.st_mtime_ns, s.st_size)
+    with _lock:
+        if key in _digests:
+            return _digests[key]
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    with _lock:
+        _digests[key] = h.hexdigest()
+    return _digests[key]
+
+
+def _out_dir(path: str):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(STATIC_DIR, MEDIA_SUBDIR, f"{stem}-{_digest(path)[:12]}")
+
+
+def probe(path: str, timeout: float = None):
+    """
+    从 ffmpeg -i 的输出里读 (宽, 高, 时长秒, 是否有音轨)；timeout 秒内读不到（如摄像头地址不通）时报错。
+    宽高是 ffmpeg 按旋转信息自动转正后的画面尺寸：手机竖拍的视频编码成横向、带 ±90° 旋转，这里宽高对调
+    """
+    try:
+        out = subprocess.run([FFMPEG, "-hide_banner", "-i", path], capture_output=True, text=True, timeout=timeout).stderr
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"{timeout:g} 秒内未能读取视频流：{path}") from None
+    video = re.search(r"Stream #.*Video:.*?, (\d{2,5})x(\d{2,5})", out)
+    if not video:
+        raise RuntimeError(f"无法识别视频流：{path}")
+    dur = re.search(r"Duration: (\d+):(\d+):([\d.]+)", out)
+    seconds = int(dur[1]) * 3600 + int(dur[2]) * 60 + float(dur[3]) if dur else 0.0
+    # 新版 ffmpeg 写在 Side data 的 displaymatrix 里，旧版写在流的 rotate 元数据里
+    rot = re.search(r"rotation of (-?[\d.]+) degrees", out) or re.search(r"\brotate\s*:\s*(-?\d+)", out)
+    w, h = int(video[1]), int(video[2])
+    if rot and round(float(rot[1])) % 180 == 90:
+        w, h = h, w
+    return w, h, seconds, "Audio:" in out
+
+
+def _even(x: float):
+    return max(2, int(round(x / 2)) * 2)
+
+
+def _ladder(src_h: int):
+    rungs = [(h, kbps) for h, kbps in LADDER if h <= src_h]
+    above = [(h, kbps) for h, kbps in LADDER if h > src_h]
+    if above and (not rungs or rungs[-1][0] < src_h):
+        rungs.append((_even(src_h), above[0][1]))
+    return rungs
+
+
+def _run(args):
+    subprocess.run([FFMPEG, "-hide_banner", "-v", "error", "-y", *args], check=True)
+
+
+def _x264(height: int, kbps: int, audio: bool):
+    args = [
+        "-vf", f"scale=-2:{height}", "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main",
+        "-pix_fmt", "yuv420p", "-b:v", f"{kbps}k", "-maxrate", f"{int(kbps * 1.07)}k", "-bufsize", f"{int(kbps * 1.5)}k",
+        # 固定 GOP 与分片时长对齐，各档分片边界一致才能无缝切换码率
+        "-force_key_frames", f"expr:gte(t,n_forced*{SEGMENT_SECONDS})", "-sc_threshold", "0",
+    ]
+    if audio:
+        args += ["-c:a", "aac", "-b:a", f"{AUDIO_KBPS}k", "-ac", "2"]
+    return args
+
+
+def transcode(path: str):
+    """同步转码一个视频，返回 manifest；已转码过直接读取"""
+    out = _out_dir(path)
+    done = os.path.join(out, MANIFEST)
+    if os.path.exists(done):
+        with open(done, encoding="utf-8") as f:
+            return json.load(f)
+
+    work = out + ".tmp"
+    shutil.rmtree(work, ignore_errors=True)
+    os.makedirs(work)
+    w, h, seconds, audio = probe(path)
+    maps = ["-map", "0:v:0"] + (["-map", "0:a:0"] if audio else [])
+
+    renditions = []
+    for height, kbps in _ladder(h):
+        name = f"{height}p"
+        os.makedirs(os.path.join(work, name))
+        _run(["-i", path, *maps, *_x264(height, kbps, audio),
+              "-f", "hls", "-hls_time", str(SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+              "-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", "init.mp4",
+              "-hls_segment_filename", os.path.join(work, name, "seg_%03d.m4s"),
+              os.path.join(work, name, "index.m3u8")])
+        bandwidth = (kbps + (AUDIO_KBPS if audio else 0)) * 1000
+        renditions.append({"name": name, "width": _even(w * height / h), "height": height, "bandwidth": bandwidth})
+
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for r in renditions:
+        lines += [f"#EXT-X-STREAM-INF:BANDWIDTH={r['bandwidth']},RESOLUTION={r['width']}x{r['height']}",
+                  f"{r['name']}/index.m3u8"]
+    with open(os.path.join(work, "master.m3u8"), "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+    fallback_h, fallback_kbps = min(_ladder(h), key=lambda r: abs(r[0] - FALLBACK_HEIGHT))
+    # moov 放到文件头，浏览器用 Range 请求即可边下边播
+    _run(["-i", path, *maps, *_x264(fallback_h, fallback_kbps, audio), "-movflags", "+faststart",
+          os.path.join(work, "fallback.mp4")])
+    _run(["-ss", f"{min(POSTER_AT, seconds / 2):.2f}", "-i", path, "-frames:v", "1",
+          "-vf", f"scale=-2:{fallback_h}", "-q:v", "4", os.path.join(work, "poster.jpg")])
+
+    manifest = {
+        "source": os.path.basename(path), "duration": seconds, "renditions": renditions,
+        "master": "master.m3u8", "fallback": "fallback.mp4", "poster": "poster.jpg",
+    }
+    with open(os.path.join(work, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(work, out)
+    return manifest
+
+
+def _background(path: str, out: str):
+    try:
+        transcode(path)
+    except Exception as e:
+        print(f"[media] 转码失败 {path}: {e}", file=sys.stderr)
+    finally:
+        with _lock:
+            _jobs.pop(out, None)
+
+
+def video_html(path: str, max_width: str = "100%"):
+    """
+    已转码时返回 <video> HTML（HLS 主清单 + MP4 回退 + 封面）；
+    否则在后台启动一次转码并返回 None，本次由调用方回退到 st.video。
+    """
+    if not static_enabled() or not os.path.exists(path):
+        return None
+    out = _out_dir(path)
+    done = os.path.join(out, MANIFEST)
+    if not os.path.exists(done):
+        if ffmpeg_available():
+            with _lock:
+                if out not in _jobs:
+                    _jobs[out] = threading.Thread(target=_background, args=(path, out), daemon=True)
+                    _jobs[out].start()
+        return None
+    with open(done, encoding="utf-8") as f:
+        manifest = json.load(f)
+    base = "app/static/" + os.path.relpath(out, STATIC_DIR).replace(os.sep, "/")
+    return (
+        f'<video controls playsinline preload="none" poster="{base}/{manifest["poster"]}" '
+        f'style="width:100%;max-width:{max_width};height:auto;display:block;">'
+        f'<source src="{base}/{manifest["master"]}" type="application/vnd.apple.mpegurl">'
+        f'<source src="{base}/{manifest["fallback"]}" type="video/mp4">'
+        f'</video>'
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("videos", nargs="+")
+    args = parser.parse_args()
+    if not ffmpeg_available():
+        sys.exit(f"未找到 ffmpeg（{FFMPEG}），请先安装或设置环境变量 FISH_FFMPEG")
+    for video in args.videos:
+        m = transcode(video)
+        print(f"{video}: {', '.join(r['name'] for r in m['renditions'])} -> {_out_dir(video)}")
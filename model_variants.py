@@ -0,0 +1,261 @@
+"""
+检测模型的精度 / 尺寸变体与按延迟预算自动选择
+- build：由 FP32 模型生成 FP16（权重半精度，输入输出仍为 float32）与 INT8（QDQ 静态量化，用验证集图片校准）两个文件
+- bench：每个模型文件 × 每个输入尺寸（动态输入的模型可以直接用更小的输入跑）在验证集上测单张延迟 p50/p95 与 mAP@0.5，
+  结果写到模型旁边的 variants.json
+- select()：在 p95 不超过 FISH_LATENCY_BUDGET_MS 的变体里挑 mAP 最高的；都超预算时退回最快的那个
+
+验证集目录里放图片；有 YOLO 格式标注（images/xxx.jpg 对应 labels/xxx.txt，或同名 .txt）时按标注算 mAP，
+没有标注时以 FP32 原尺寸的检测结果为参照，算各变体与它的一致程度。
+
+用法（项目根目录，需要额外安装 onnx）：
+    python -m model_variants build --val data/val
+    python -m model_variants bench --val data/val --sizes 640 480 320
+"""
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import detector
+
+VARIANTS_FILE = os.path.join(os.path.dirname(detector.MODEL_PATH) or ".", "variants.json")
+LATENCY_BUDGET_MS = float(os.getenv("FISH_LATENCY_BUDGET_MS", "250"))
+DEFAULT_SIZES = (640, 480, 320)
+EVAL_CONF = 0.05                # 算 mAP 时的置信度下限
+PSEUDO_LABEL_CONF = 0.5         # 无标注时参照结果的置信度
+IOU_MATCH = 0.5
+MIN_RUNS = 30                   # 延迟统计的最少推理次数
+CALIBRATION_IMAGES = 64         # INT8 校准最多用多少张图片
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+_lock = threading.Lock()
+_memo = {"key": None, "choice": None}
+
+
+def _variant_paths(model_path: str):
+    stem, ext = os.path.splitext(model_path)
+    return {"fp32": model_path, "fp16": f"{stem}.fp16{ext}", "int8": f"{stem}.int8{ext}"}
+
+
+# =============== 验证集 ===============
+def load_validation(folder: str):
+    """[(图片路径, 标注 ndarray (k, 5): 类别, x0, y0, x1, y1 原图像素；无标注为 None)]"""
+    from PIL import Image
+
+    items = []
+    for path in sorted(glob.glob(os.path.join(folder, "**", "*"), recursive=True)):
+        if os.path.splitext(path)[1].lower() not in IMAGE_EXTS:
+            continue
+        stem = os.path.splitext(path)[0]
+        candidates = [stem + ".txt"]
+        if f"{os.sep}images{os.sep}" in path:
+            candidates.insert(0, stem.replace(f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}") + ".txt")
+        label = next((c for c in candidates if os.path.exists(c)), None)
+        boxes = None
+        if label:
+            with Image.open(path) as im:
+                w, h = im.size
+            rows = np.loadtxt(label, ndmin=2).reshape(-1, 5)
+            cx, cy, bw, bh = rows[:, 1] * w, rows[:, 2] * h, rows[:, 3] * w, rows[:, 4] * h
+            boxes = np.stack([rows[:, 0], cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+        items.append((path, boxes))
+    return items
+
+
+def _iou(box, boxes):
+    x0 = np.maximum(box[0], boxes[:, 0])
+    y0 = np.maximum(box[1], boxes[:, 1])
+    x1 = np.minimum(box[2], boxes[:, 2])
+    y1 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / (area + areas - inter + 1e-9)
+
+
+def map50(predictions, truths):
+    """predictions / truths：逐图的检测结果与标注 (k, 5)；返回各类别 AP@0.5 的平均（只算出现过的类别）"""
+    aps = []
+    for c in range(len(detector.LABELS)):
+        scored, n_true = [], 0
+        for dets, gt in zip(predictions, truths):
+            gt_c = gt[gt[:, 0] == c, 1:] if gt is not None and len(gt) else np.empty((0, 4))
+            n_true += len(gt_c)
+            used = np.zeros(len(gt_c), dtype=bool)
+            for d in sorted((d for d in dets if d["class_id"] == c), key=lambda d: -d["score"]):
+                hit = False
+                if len(gt_c):
+                    ious = _iou(np.array(d["box"]), gt_c)
+                    j = int(ious.argmax())
+                    if ious[j] >= IOU_MATCH and not used[j]:
+                        used[j] = hit = True
+                scored.append((d["score"], hit))
+        if n_true == 0:
+            continue
+        scored.sort(key=lambda s: -s[0])
+        hits = np.array([h for _, h in scored], dtype=float)
+        tp, fp = np.cumsum(hits), np.cumsum(1 - hits)
+        recall = np.concatenate([[0], tp / n_true, [1]])
+        precision = np.concatenate([[1], tp / np.maximum(tp + fp, 1e-9), [0]])
+        precision = np.maximum.accumulate(precision[::-1])[::-1]      # 全点插值
+        aps.append(float(np.sum(np.diff(recall) * precision[1:])))
+    return float(np.mean(aps)) if aps else 0.0
+
+
+# =============== build ===============
+def build(model_path: str, val_folder: str):
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.transformers.float16 import convert_float_to_float16
+
+    paths = _variant_paths(model_path)
+    fp16 = convert_float_to_float16(onnx.load(model_path), keep_io_types=True)
+    onnx.save(fp16, paths["fp16"])
+    print(f"FP16 -> {paths['fp16']}")
+
+    items = load_validation(val_folder)
+    if not items:
+        raise SystemExit(f"验证集 {val_folder} 里没有图片，无法做 INT8 校准")
+    engine = detector.Detector(model_path, batching=False)
+
+    class Calibration(CalibrationDataReader):
+        """INT8 静态量化的校准数据：验证集图片按模型输入预处理"""
+
+        def __init__(self, paths):
+            from PIL import Image
+
+            self._items = []
+            for path in paths:
+                with Image.open(path) as im:
+                    x, _ = engine.preprocess(im)
+                self._items.append({engine.input_name: x[None]})
+            self._it = iter(self._items)
+
+        def get_next(self):
+            return next(self._it, None)
+
+        def rewind(self):
+            self._it = iter(self._items)
+
+    reader = Calibration([p for p, _ in items[:CALIBRATION_IMAGES]])
+    quantize_static(
+        model_path, paths["int8"], reader, quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True,
+    )
+    print(f"INT8 -> {paths['int8']}（校准图片 {min(len(items), CALIBRATION_IMAGES)} 张）")
+
+
+# =============== bench ===============
+def _measure(engine, images, conf: float):
+    """逐张推理（与线上单张请求一致），返回 (各图检测结果, 延迟毫秒列表)"""
+    preds, times = [], []
+    runs = max(MIN_RUNS, len(images))
+    for i in range(runs):
+        image = images[i % len(images)]
+        t0 = time.perf_counter()
+        x, meta = engine.preprocess(image)
+        dets = engine.postprocess(engine.infer(x[None])[0], meta, image.size, conf)
+        times.append((time.perf_counter() - t0) * 1000)
+        if i < len(images):
+            preds.append(dets)
+    return preds, times
+
+
+def bench(model_path: str, val_folder: str, sizes=DEFAULT_SIZES, out: str = VARIANTS_FILE):
+    from PIL import Image
+
+    items = load_validation(val_folder)
+    if not items:
+        raise SystemExit(f"验证集 {val_folder} 里没有图片")
+    images = []
+    for path, _ in items:
+        with Image.open(path) as im:
+            images.append(im.convert("RGB"))
+    truths = [gt for _, gt in items]
+    labelled = all(gt is not None for gt in truths)
+
+    results = []
+    for precision, path in _variant_paths(model_path).items():
+        if not os.path.exists(path):
+            continue
+        for size in sizes:
+            engine = detector.Detector(path, batching=False, input_size=size)
+            if engine.size != (size, size) and size != sizes[0]:
+                continue                                # 固定输入尺寸的模型只测一次
+            preds, times = _measure(engine, images, EVAL_CONF)
+            if not labelled and not results:
+                # 没有标注：以第一个变体（FP32 原尺寸）的高置信度结果作为参照
+                truths = [np.array([[d["class_id"], *d["box"]] for d in p if d["score"] >= PSEUDO_LABEL_CONF]).reshape(-1, 5)
+                          for p in preds]
+            results.append({
+                "name": f"{precision}-{engine.size[0]}", "path": path, "precision": precision,
+                "input_size": engine.size[0],
+                "p50_ms": float(np.percentile(times, 50)), "p95_ms": float(np.percentile(times, 95)),
+                "map50": map50(preds, truths),
+            })
+            r = results[-1]
+            print(f"{r['name']:<12} p50 {r['p50_ms']:7.1f} ms  p95 {r['p95_ms']:7.1f} ms  mAP50 {r['map50']:.3f}")
+
+    report = {
+        "model": os.path.abspath(model_path), "metric": "map50" if labelled else "map50_vs_fp32",
+        "images": len(images), "cpu_count": os.cpu_count(), "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "variants": results,
+    }
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    choice = _pick(results, LATENCY_BUDGET_MS)
+    print(f"写入 {out}；p95 预算 {LATENCY_BUDGET_MS:.0f} ms 下选用 {choice['name']}")
+    return report
+
+
+# =============== select ===============
+def _pick(variants, budget_ms: float):
+    within = [v for v in variants if v["p95_ms"] <= budget_ms]
+    if within:
+        return max(within, key=lambda v: (v["map50"], -v["p95_ms"]))
+    return min(variants, key=lambda v: v["p95_ms"])
+
+
+def select(path: str = VARIANTS_FILE, budget_ms: float = LATENCY_BUDGET_MS):
+    """按延迟预算选出的变体（dict，含 path / input_size / name 等）；没有测评结果时返回 None"""
+    try:
+        key = (os.stat(path).st_mtime_ns, budget_ms)
+    except OSError:
+        return None
+    with _lock:
+        if _memo["key"] == key:
+            return _memo["choice"]
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    variants = []
+    if report.get("model") == os.path.abspath(detector.MODEL_PATH):      # 测评结果须对应当前模型
+        variants = [v for v in report["variants"] if os.path.exists(v["path"])]
+    choice = _pick(variants, budget_ms) if variants else None
+    with _lock:
+        _memo.update(key=key, choice=choice)
+    return choice
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    for name in ("build", "bench"):
+        p = sub.add_parser(name)
+        p.add_argument("--model", default=detector.MODEL_PATH)
+        p.add_argument("--val", required=True, help="验证集图片目录")
+        if name == "bench":
+            p.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+            p.add_argument("--out", default=VARIANTS_FILE)
+    args = parser.parse_args()
+    if detector.ort is None:
+        raise SystemExit("未安装 onnxruntime")
+    if args.cmd == "build":
+        build(args.model, args.val)
+    else:
+        bench(args.model, args.val, args.sizes, args.out)
@@ -0,0 +1,515 @@
+"""
+多养殖场 / 多池塘数据集
+- 数据来源：data.xlsx（默认养殖场/1号池）+ ponds/<养殖场>.xlsx（每个工作表一个池塘，表名即池塘名）
+- 按 养殖场/池塘/年份 分区存成 Feather，选中某个池塘时只内存映射读取它的分区
+- “全部池塘”“某养殖场全部池塘”的汇总在同步时增量维护，页面不再逐个拼接工作表
+- 逐日新数据可从侧边栏上传或放进 ponds_inbox/，只追加到对应分区并增量更新统计量
+- 每个池塘/汇总的患病总数有一份 TrendIndex，任意时间范围的统计 O(1)/O(log n)
+- 追加时可标记为不计入汇总（如识别页的检测结果），这类序列只能按池塘单独查看，不改变盘点数据的汇总
+"""
+import glob
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import fish_data
+from fish_data import DEFAULT_FARM, DEFAULT_POND, SICK_METRIC, TOTAL_METRIC, finish_long
+from trend_index import TrendIndex
+
+POND_DATA_DIR = "ponds"
+STORE_DIR = os.path.join(fish_data.SIDECAR_DIR, "ponds")
+ALL = "全部"
+ALL_KEY = "*"                   # 汇总键：全部养殖场
+PARTITION_CACHE_MAX = 256       # 进程内缓存的分区文件数
+INBOX_DIR = "ponds_inbox"       # 投放待追加文件的目录，处理后移到 done/ 或 failed/
+INBOX_EXTS = (".csv", ".xlsx", ".json")
+INGEST_SOURCE = "追加"          # 只由追加数据产生的池塘
+
+_lock = threading.RLock()
+_manifest = None
+_part_cache = OrderedDict()     # (路径, mtime_ns) -> DataFrame
+_stats = {"hits": 0, "misses": 0}
+_indexes = {}                   # ("entity"/"rollup", 键) -> (数据版本, TrendIndex)
+
+
+def _q(name: str):
+    return quote(str(name), safe="")
+
+
+def _entity_key(farm: str, pond: str):
+    return f"{_q(farm)}/{_q(pond)}"
+
+
+def _entity_dir(farm: str, pond: str):
+    return os.path.join(STORE_DIR, f"farm={_q(farm)}", f"pond={_q(pond)}")
+
+
+def _appended_path(farm: str, pond: str):
+    return os.path.join(STORE_DIR, "_appended", f"farm={_q(farm)}", f"pond={_q(pond)}.feather")
+
+
+def _rollup_path(key: str):
+    name = "all" if key == ALL_KEY else f"farm={_q(key)}"
+    return os.path.join(STORE_DIR, "_rollup", name + ".feather")
+
+
+def _write_feather(df: pd.DataFrame, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    feather.write_feather(pa.Table.from_pandas(df, preserve_index=True), tmp, compression="uncompressed")
+    os.replace(tmp, path)
+
+
+def _read_feather(path: str):
+    """内存映射读取单个分区文件，按 (路径, mtime) 在进程内缓存"""
+    key = (path, os.stat(path).st_mtime_ns)
+    with _lock:
+        if key in _part_cache:
+            _part_cache.move_to_end(key)
+            _stats["hits"] += 1
+            return _part_cache[key]
+        _stats["misses"] += 1
+        df = feather.read_table(path, memory_map=True).to_pandas()
+        _part_cache[key] = df
+        while len(_part_cache) > PARTITION_CACHE_MAX:
+            _part_cache.popitem(last=False)
+        return df
+
+
+# =============== 清单 ===============
+def _manifest_path():
+    return os.path.join(STORE_DIR, "manifest.json")
+
+
+def _load_manifest():
+    try:
+        with open(_manifest_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"sources": {}, "entities": {}, "rollups": {}}
+
+
+def _save_manifest(m):
+    path = _manifest_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(m, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+# =============== 同步 ===============
+def list_sources():
+    paths = []
+    if os.path.exists(fish_data.DATA_PATH):
+        paths.append(os.path.abspath(fish_data.DATA_PATH))
+    paths += sorted(
+        os.path.abspath(p) for p in glob.glob(os.path.join(POND_DATA_DIR, "*.xlsx"))
+        if not os.path.basename(p).startswith("~$")      # Excel 打开时的锁文件
+    )
+    return paths
+
+
+def _parse_source(path: str):
+    """返回 {(养殖场, 池塘): 长表}"""
+    if path == os.path.abspath(fish_data.DATA_PATH):
+        return {(DEFAULT_FARM, DEFAULT_POND): fish_data.load_workbook(path)["long"]}
+    farm = os.path.splitext(os.path.basename(path))[0]
+    out = {}
+    for sheet, df in pd.read_excel(path, sheet_name=None).items():
+        pond = str(sheet).strip()
+        try:
+            out[(farm, pond)] = fish_data.normalize_frame(df, farm, pond)
+        except (KeyError, IndexError):
+            continue        # 空表或不是数据表
+    return out
+
+
+def _daily_sick(long_df: pd.DataFrame):
+    return fish_data.metric_series(long_df, SICK_METRIC).groupby(level=0).sum()
+
+
+def _snapshot(long_df: pd.DataFrame):
+    dist, total_val = fish_data.distribution(long_df)
+    snap = long_df[long_df["metric"].to_numpy() != SICK_METRIC]
+    date = snap.index.max() if len(snap) else long_df.index.max()
+    return {
+        "date": pd.Timestamp(date).isoformat(),
+        "values": dict(zip(dist["类别"], dist["数量"].astype(float))),
+        "total": total_val,
+    }
+
+
+def _sick_stats(daily: pd.Series):
+    """患病总数的可增量维护统计量；daily 为按日期升序的序列"""
+    if not len(daily):
+        return None
+    v = daily.to_numpy()
+    return {
+        "n": int(len(v)), "sum": float(v.sum()), "max": float(v.max()), "min": float(v.min()),
+        "first_date": daily.index[0].isoformat(), "first": float(v[0]),
+        "last_date": daily.index[-1].isoformat(), "last": float(v[-1]),
+    }
+
+
+def _extend_stats(stats, daily: pd.Series):
+    """daily 的日期都晚于已有数据时，直接合并统计量"""
+    new = _sick_stats(daily)
+    if stats is None or new is None:
+        return stats or new
+    return {
+        "n": stats["n"] + new["n"], "sum": stats["sum"] + new["sum"],
+        "max": max(stats["max"], new["max"]), "min": min(stats["min"], new["min"]),
+        "first_date": stats["first_date"], "first": stats["first"],
+        "last_date": new["last_date"], "last": new["last"],
+    }
+
+
+def _get_rollup(rollups, key):
+    if key not in rollups:
+        path = _rollup_path(key)
+        rollups[key] = _read_feather(path) if os.path.exists(path) else pd.DataFrame(
+            {"value": pd.Series(dtype="float64"), "n": pd.Series(dtype="int64")},
+            index=pd.DatetimeIndex([], name="date"))
+    return rollups[key]
+
+
+def _apply_daily(rollups, key, daily: pd.Series, sign: int):
+    """把单个池塘的逐日患病数加到 / 减出汇总；n 记录每天有几个池塘贡献"""
+    delta = pd.DataFrame({"value": daily.to_numpy() * sign, "n": sign}, index=daily.index)
+    merged = pd.concat([_get_rollup(rollups, key), delta]).groupby(level=0).sum()
+    rollups[key] = merged[merged["n"] > 0]
+
+
+def _drop_entity(m, rollups, key):
+    ent = m["entities"].pop(key)
+    daily = _daily_sick(_read_entity(ent))
+    for rk in (ALL_KEY, ent["farm"]):
+        _apply_daily(rollups, rk, daily, -1)
+    shutil.rmtree(_entity_dir(ent["farm"], ent["pond"]), ignore_errors=True)
+
+
+def _add_entity(m, rollups, source: str, farm: str, pond: str, long_df: pd.DataFrame):
+    # 重新解析工作簿时，把之前追加、且晚于工作簿最后一天的数据接回去
+    appended = _appended_path(farm, pond)
+    if os.path.exists(appended):
+        extra = _read_feather(appended)
+        if len(long_df):
+            extra = extra.loc[extra.index > long_df.index.max()]
+        long_df = finish_long(pd.concat([long_df, extra]).reset_index())
+
+    d = _entity_dir(farm, pond)
+    shutil.rmtree(d, ignore_errors=True)
+    years = []
+    for year, part in long_df.groupby(long_df.index.year):
+        _write_feather(part, os.path.join(d, f"year={int(year)}.feather"))
+        years.append(int(year))
+    has_snapshot = (long_df["metric"].to_numpy() != SICK_METRIC).any()
+    daily = _daily_sick(long_df)
+    m["entities"][_entity_key(farm, pond)] = {
+        "farm": farm, "pond": pond, "source": source, "years": years,
+        "snapshot": _snapshot(long_df) if has_snapshot else None,
+        "stats": _sick_stats(daily),
+        "last_date": long_df.index.max().isoformat() if len(long_df) else None,
+    }
+    for rk in (ALL_KEY, farm):
+        _apply_daily(rollups, rk, daily, +1)
+
+
+def _refresh_rollup_snapshots(m):
+    """汇总快照 = 各池塘最近快照之和，只用清单里的小字典，不读分区"""
+    groups = {}
+    for ent in m["entities"].values():
+        if ent["snapshot"] is None or not ent.get("rollup", True):
+            continue
+        for rk in (ALL_KEY, ent["farm"]):
+            g = groups.setdefault(rk, {"date": ent["snapshot"]["date"], "values": {}, "total": 0.0})
+            g["date"] = max(g["date"], ent["snapshot"]["date"])
+            g["total"] += ent["snapshot"]["total"]
+            for k, v in ent["snapshot"]["values"].items():
+                g["values"][k] = g["values"].get(k, 0.0) + v
+    m["rollups"] = groups
+
+
+def sync():
+    """
+    检查数据来源，只重新解析 mtime/size 变化过的工作簿，并增量更新汇总。
+    每次页面重跑调用开销仅为几次 stat。
+    """
+    global _manifest
+    with _lock:
+        m = _manifest if _manifest is not None else _load_manifest()
+        sources = list_sources()
+        rollups = {}
+        changed = False
+
+        for path in [p for p in m["sources"] if p not in sources]:
+            for key in [k for k, e in m["entities"].items() if e["source"] == path]:
+                ent = m["entities"][key]
+                _drop_entity(m, rollups, key)
+                if os.path.exists(_appended_path(ent["farm"], ent["pond"])):
+                    _add_entity(m, rollups, INGEST_SOURCE, ent["farm"], ent["pond"], finish_long(
+                        pd.DataFrame({"date": [], "metric": [], "value": []}), ent["farm"], ent["pond"]))
+            del m["sources"][path]
+            changed = True
+
+        for path in sources:
+            st_ = os.stat(path)
+            rec = m["sources"].get(path)
+            if rec and rec["mtime_ns"] == st_.st_mtime_ns and rec["size"] == st_.st_size:
+                continue
+            for key in [k for k, e in m["entities"].items() if e["source"] == path]:
+                _drop_entity(m, rollups, key)
+            for (farm, pond), long_df in _parse_source(path).items():
+                _add_entity(m, rollups, path, farm, pond, long_df)
+            m["sources"][path] = {"mtime_ns": st_.st_mtime_ns, "size": st_.st_size}
+            changed = True
+
+        if changed:
+            stats = m.setdefault("rollup_stats", {})
+            for key, df in rollups.items():
+                stats[key] = _sick_stats(df["value"])
+                if len(df) or key == ALL_KEY:
+                    _write_feather(df, _rollup_path(key))
+                elif os.path.exists(_rollup_path(key)):
+                    os.remove(_rollup_path(key))       # 该养殖场已无池塘
+            _refresh_rollup_snapshots(m)
+            m["version"] = m.get("version", 0) + 1
+            _save_manifest(m)
+        _manifest = m
+        _ingest_inbox()
+        return m
+
+
+# =============== 追加 ===============
+def _rollup_stats_after_append(m, key, frame: pd.DataFrame, daily: pd.Series):
+    """
+    追加后只用受影响日期更新汇总统计量：
+    sum/n/max 直接累加；只有当原最小值所在日期被加大时才回到汇总表重新取最小值。
+    """
+    stats = m.setdefault("rollup_stats", {})
+    old = stats.get(key)
+    if old is None:
+        stats[key] = _sick_stats(frame["value"])
+        return
+    touched = frame.loc[daily.index]
+    after = touched["value"]
+    before = after - daily.to_numpy()
+    is_new = (touched["n"] == 1).to_numpy()
+    new = dict(old)
+    new["n"] += int(is_new.sum())
+    new["sum"] += float(daily.sum())
+    new["max"] = max(old["max"], float(after.max()))
+    raised_min = ((before.to_numpy() == old["min"]) & ~is_new & (daily.to_numpy() > 0)).any()
+    new["min"] = float(frame["value"].min()) if raised_min else min(old["min"], float(after.min()))
+    first = min(pd.Timestamp(old["first_date"]), daily.index[0])
+    last = max(pd.Timestamp(old["last_date"]), daily.index[-1])
+    new.update(first_date=first.isoformat(), first=float(frame.at[first, "value"]),
+               last_date=last.isoformat(), last=float(frame.at[last, "value"]))
+    stats[key] = new
+
+
+def append(rows_by_entity, rollup: bool = True):
+    """
+    追加逐日数据（fish_data.parse_rows 的结果）。只接受晚于该池塘已有最后一天的行，
+    只改写受影响年份的分区，并增量更新该池塘及汇总的统计量和分布。
+    rollup=False 时新建的池塘不计入“全部”和养殖场汇总（已有池塘沿用建立时的设置）。
+    返回 {"added": 追加的天数, "skipped": 因日期不晚于已有数据而跳过的天数}
+    """
+    report = {"added": 0, "skipped": 0}
+    with _lock:
+        m = _manifest if _manifest is not None else sync()
+        rollups = {}
+        snapshots_changed = False
+        for (farm, pond), rows in rows_by_entity.items():
+            key = _entity_key(farm, pond)
+            ent = m["entities"].setdefault(key, {
+                "farm": farm, "pond": pond, "source": INGEST_SOURCE, "years": [],
+                "snapshot": None, "stats": None, "last_date": None, "rollup": rollup,
+            })
+            if ent["last_date"] is not None:
+                keep = rows.index > pd.Timestamp(ent["last_date"])
+                report["skipped"] += rows.index[~keep].nunique()
+                rows = rows[keep]
+            if not len(rows):
+                continue
+            report["added"] += rows.index.nunique()
+            rows = finish_long(rows.reset_index(), farm, pond)
+
+            # 只改写新数据所在年份的分区
+            d = _entity_dir(farm, pond)
+            for year, part in rows.groupby(rows.index.year):
+                path = os.path.join(d, f"year={int(year)}.feather")
+                old_part = _read_feather(path) if int(year) in ent["years"] else None
+                merged = part if old_part is None else finish_long(pd.concat([old_part, part]).reset_index())
+                _write_feather(merged, path)
+                if int(year) not in ent["years"]:
+                    ent["years"].append(int(year))
+
+            # 追加记录单独保存，工作簿重新解析时据此接回
+            log_path = _appended_path(farm, pond)
+            log = _read_feather(log_path) if os.path.exists(log_path) else None
+            _write_feather(rows if log is None else finish_long(pd.concat([log, rows]).reset_index()), log_path)
+
+            daily = _daily_sick(rows)
+            ent["stats"] = _extend_stats(ent["stats"], daily)
+            ent["last_date"] = rows.index.max().isoformat()
+            cached = _indexes.get(("entity", key))
+            if cached and len(daily):
+                cached[1].extend(daily)                 # 新日期都在末尾，原地扩展
+                _indexes[("entity", key)] = (_stats_version(ent["stats"]), cached[1])
+            if len(daily) and ent.get("rollup", True):
+                for rk in (ALL_KEY, farm):
+                    _apply_daily(rollups, rk, daily, +1)
+                    _rollup_stats_after_append(m, rk, rollups[rk], daily)
+            if (rows["metric"].to_numpy() != SICK_METRIC).any():
+                # 与 _add_entity 一样按整个池塘的长表取快照：新行没有鱼类总数时沿用之前的值，汇总与全量重建一致
+                ent["snapshot"] = _snapshot(_read_entity(ent))
+                snapshots_changed = True
+
+        if snapshots_changed:
+            _refresh_rollup_snapshots(m)
+        for key, df in rollups.items():
+            _write_feather(df, _rollup_path(key))
+        if report["added"]:
+            m["version"] = m.get("version", 0) + 1
+            _save_manifest(m)
+    return report
+
+
+def _ingest_inbox():
+    """处理投放目录里的文件，成功移到 done/，失败移到 failed/"""
+    if not os.path.isdir(INBOX_DIR):
+        return
+    for name in sorted(os.listdir(INBOX_DIR)):
+        path = os.path.join(INBOX_DIR, name)
+        if not os.path.isfile(path) or os.path.splitext(name)[1].lower() not in INBOX_EXTS:
+            continue
+        try:
+            append(fish_data.parse_rows(path, name))
+            dest = "done"
+        except Exception:       # 损坏的文件（如 xlsx 解压失败）不能卡住每次同步，移走后继续
+            dest = "failed"
+        os.makedirs(os.path.join(INBOX_DIR, dest), exist_ok=True)
+        os.replace(path, os.path.join(INBOX_DIR, dest, name))
+
+
+# =============== 查询 ===============
+def data_version():
+    """数据集版本号，每次同步有变化或追加数据后加一，用作图表等派生结果的缓存键"""
+    with _lock:
+        return (_manifest or {}).get("version", 0)
+
+
+def farms():
+    with _lock:
+        return sorted({e["farm"] for e in (_manifest or {"entities": {}})["entities"].values()})
+
+
+def ponds(farm: str):
+    with _lock:
+        return sorted(e["pond"] for e in (_manifest or {"entities": {}})["entities"].values() if e["farm"] == farm)
+
+
+def read_entity(farm: str, pond: str, start=None, end=None):
+    """只读取该池塘落在 [start, end] 内年份的分区"""
+    with _lock:
+        ent = _manifest["entities"][_entity_key(farm, pond)]
+    return _read_entity(ent, start, end)
+
+
+def _read_entity(ent, start=None, end=None):
+    farm, pond = ent["farm"], ent["pond"]
+    lo = pd.Timestamp(start).year if start is not None else None
+    hi = pd.Timestamp(end).year if end is not None else None
+    parts = [
+        _read_feather(os.path.join(_entity_dir(farm, pond), f"year={y}.feather"))
+        for y in ent["years"]
+        if (lo is None or y >= lo) and (hi is None or y <= hi)
+    ]
+    if not parts:
+        return finish_long(pd.DataFrame({"date": [], "metric": [], "value": [], "farm": farm, "pond": pond}))
+    long_df = pd.concat(parts) if len(parts) > 1 else parts[0]
+    if start is not None or end is not None:
+        long_df = long_df.loc[start:end]
+    return long_df
+
+
+def sick_stats(farm: str = None, pond: str = None):
+    """
+    全部数据的患病总数统计量（max/min/mean、首尾值），随同步与追加增量维护。
+    farm 为空取全部池塘汇总，pond 为空取该养殖场汇总。
+    """
+    with _lock:
+        if farm and pond:
+            stats = _manifest["entities"][_entity_key(farm, pond)]["stats"]
+        else:
+            stats = _manifest.get("rollup_stats", {}).get(farm or ALL_KEY)
+    if stats is None:
+        return None
+    return {**stats, "mean": stats["sum"] / stats["n"]}
+
+
+def _stats_version(stats):
+    return None if stats is None else (stats["n"], stats["sum"], stats["last_date"])
+
+
+def trend_index(farm: str = None, pond: str = None):
+    """
+    所选池塘（或汇总）患病总数的 TrendIndex。
+    数据版本变化时重建；池塘追加数据时已在 append 中原地扩展，不会重建。
+    """
+    with _lock:
+        if farm and pond:
+            key = ("entity", _entity_key(farm, pond))
+            stats = _manifest["entities"][key[1]]["stats"]
+        else:
+            key = ("rollup", farm or ALL_KEY)
+            stats = _manifest.get("rollup_stats", {}).get(key[1])
+        version = _stats_version(stats)
+        cached = _indexes.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+        long_df = read_entity(farm, pond) if farm and pond else read_rollup(farm)
+        index = TrendIndex(_daily_sick(long_df))
+        _indexes[key] = (version, index)
+        return index
+
+
+def read_rollup(farm: str = None, start=None, end=None):
+    """全部池塘（farm 为空）或某养殖场全部池塘的汇总长表"""
+    key = farm or ALL_KEY
+    with _lock:
+        snap = _manifest["rollups"].get(key)
+    path = _rollup_path(key)
+    daily = _read_feather(path) if os.path.exists(path) else None
+
+    parts = []
+    if snap:
+        metrics = list(snap["values"])
+        values = list(snap["values"].values())
+        if snap["total"] > 0:
+            metrics.insert(0, TOTAL_METRIC)
+            values.insert(0, snap["total"])
+        parts.append(pd.DataFrame({"date": pd.Timestamp(snap["date"]), "metric": metrics, "value": values}))
+    if daily is not None and len(daily):
+        parts.append(pd.DataFrame({"date": daily.index, "metric": SICK_METRIC, "value": daily["value"].to_numpy()}))
+    if not parts:
+        parts.append(pd.DataFrame({"date": [], "metric": [], "value": []}))
+    long_df = finish_long(pd.concat(parts, ignore_index=True), farm or ALL, ALL)
+    if start is not None or end is not None:
+        long_df = long_df.loc[start:end]
+    return long_df
+
+
+def cache_info():
+    """分区文件缓存的命中/未命中次数"""
+    with _lock:
+        return {"hits": _stats["hits"], "misses": _stats["misses"], "entries": len(_part_cache)}
@@ -0,0 +1,39 @@
+"""
+论坛帖子的时间衰减热度
+- 热度 = Σ 权重 × 2^(-(现在 - 事件时间) / 半衰期)，浏览、回复、点赞、发帖各有权重
+- 所有帖子随时间按同一比例衰减，排序不会因为时间流逝而改变，因此存的是相对固定起点的对数分数：
+  log2 Σ 权重 × 2^((事件时间 - EPOCH) / 半衰期)。每个事件只更新一条帖子的分数（O(1)），
+  不需要定时重算所有帖子；数据库在分数列上建索引，取前 K 名就是一次索引扫描（O(log n + K)）
+- 要显示的当前热度再乘回 2^(-(现在 - EPOCH) / 半衰期)
+"""
+import math
+from datetime import datetime
+
+HALF_LIFE_HOURS = 72.0
+WEIGHTS = {"post": 1.0, "view": 1.0, "like": 3.0, "reply": 5.0}
+EPOCH = datetime(2025, 1, 1)
+EMPTY = float("-inf")           # 没有任何事件的分数
+
+
+def _age(when: datetime):
+    return (when - EPOCH).total_seconds() / 3600 / HALF_LIFE_HOURS
+
+
+def point(kind: str, when: datetime = None, weight: float = None):
+    """单个事件的对数分数：log2(权重) + (事件时间 - EPOCH) / 半衰期"""
+    return math.log2(WEIGHTS[kind] if weight is None else weight) + _age(when or datetime.now())
+
+
+def combine(a: float, b: float):
+    """两个对数分数相加：log2(2^a + 2^b)，不会溢出；数据库里注册为 SQL 函数 logaddexp2"""
+    if a is None or a == EMPTY:
+        return b
+    hi, lo = max(a, b), min(a, b)
+    return hi + math.log2(1 + 2 ** (lo - hi))
+
+
+def current(score: float, now: datetime = None):
+    """当前（已衰减）的热度值"""
+    if score is None or score == EMPTY:
+        return 0.0
+    return 2 ** (score - _age(now or datetime.now()))
@@ -0,0 +1,115 @@
+"""
+检测结果缓存
+- 键：解码后像素的哈希 + 模型版本。同一张照片重复上传、换设备上传（文件名、EXIF 不同但像素相同）都能命中
+- 值：置信度下限（detector.CONF_FLOOR）以上、NMS 之前的候选框，按得分降序；页面按当前滑块阈值
+  用 detector.select() 截取并做 NMS，调整置信度不需要重新推理
+- 两级：进程内 LRU（最近用过的若干条）+ 磁盘 .data_cache/detections/*.npz；
+  磁盘条目的 mtime 即最近使用时间，超过条数上限时删最久未用的
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_DIR = os.path.join(".data_cache", "detections")      # 与数据查询页的缓存放在同一目录下
+CACHE_FORMAT = "2"
+MAX_DISK_ENTRIES = 20000
+MAX_MEMORY_ENTRIES = 256
+
+_lock = threading.Lock()
+_memory = OrderedDict()         # (像素哈希, 模型版本) -> 结果数组
+_disk = None                    # 文件名 -> 最近使用时间；首次用到时扫描目录建立
+_stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+
+def pixel_hasher(width: int, height: int):
+    """
+    解码后像素的哈希（与文件格式、元数据无关）：按行序依次 update RGB 字节，
+    hexdigest() 即缓存键；大图可以逐条喂入，不必一次拿到整图字节
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{width}x{height}".encode())
+    return h
+
+
+def _name(digest: str, version: str):
+    return f"{digest}-{version}-f{CACHE_FORMAT}.npz"
+
+
+def _disk_index():
+    """调用方持有 _lock"""
+    global _disk
+    if _disk is None:
+        _disk = OrderedDict()
+        if os.path.isdir(CACHE_DIR):
+            entries = sorted(os.scandir(CACHE_DIR), key=lambda e: e.stat().st_mtime)
+            for e in entries:
+                if e.name.endswith(".npz"):
+                    _disk[e.name] = e.stat().st_mtime
+    return _disk
+
+
+def get(digest: str, version: str):
+    """命中返回 {"boxes", "scores", "class_ids"}，否则 None"""
+    key = (digest, version)
+    name = _name(digest, version)
+    with _lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+            _stats["hits"] += 1
+            return _memory[key]
+        on_disk = name in _disk_index()
+    if on_disk:
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            with np.load(path) as z:
+                value = {k: z[k] for k in ("boxes", "scores", "class_ids")}
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            value = None
+        if value is not None:
+            with _lock:
+                _disk.move_to_end(name)
+                _remember(key, value)
+                _stats["hits"] += 1
+                _stats["disk_hits"] += 1
+            return value
+    with _lock:
+        _stats["misses"] += 1
+    return None
+
+
+def _remember(key, value):
+    _memory[key] = value
+    _memory.move_to_end(key)
+    while len(_memory) > MAX_MEMORY_ENTRIES:
+        _memory.popitem(last=False)
+
+
+def put(digest: str, version: str, value):
+    name = _name(digest, version)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, name)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **value)
+    os.replace(tmp, path)
+    stale = []
+    with _lock:
+        _remember((digest, version), value)
+        index = _disk_index()
+        index[name] = os.path.getmtime(path)
+        index.move_to_end(name)
+        while len(index) > MAX_DISK_ENTRIES:
+            stale.append(index.popitem(last=False)[0])
+    for old in stale:
+        try:
+            os.remove(os.path.join(CACHE_DIR, old))
+        except OSError:
+            pass
+
+
+def cache_info():
+    with _lock:
+        return {**_stats, "memory_entries": len(_memory), "disk_entries": len(_disk) if _disk is not None else None}
@@ -0,0 +1,122 @@
+"""
+大图分块检测
+- 手机拍的整缸 / 整塘照片常在 1200 万像素以上，整图缩到模型输入尺寸后，眼部病变、早期溃疡这类小病灶只剩几个像素
+- 分块模式按模型输入尺寸把原图切成互相重叠的小块，原分辨率逐块推理（经引擎的 candidates_many 合批），
+  另做一次整图推理负责跨块的大目标；各块结果平移回原图坐标后合并，由 detector.select() 做跨块 NMS
+- 碰到内侧块边的框多半是被切开的半截目标，直接丢弃：小目标在相邻块的重叠区里是完整的，大目标由整图推理给出
+- 上传的图片逐条转换写入 .data_cache/tiles 下的内存映射文件，同时对写入的像素求哈希（结果缓存的键）；
+  之后的推理都从映射读取，小块是映射上的切片，按批惰性读取，同一时刻内存里只有一批小块
+"""
+import os
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+import batcher
+import detector
+import result_cache
+
+TILE_DIR = os.path.join(".data_cache", "tiles")
+TILE_OVERLAP = 0.2              # 相邻小块的重叠比例
+MIN_SIDE_FACTOR = 1.5           # 长边超过模型输入的这么多倍才分块
+EDGE_MARGIN = 2                 # 离内侧块边不到这么多像素的框视为被切开
+MAX_SPILL_FILES = 16            # 内存映射文件最多保留几张图
+SPILL_ROWS = 256                # 写映射文件时每次转换的行数
+
+
+def needed(frame: np.ndarray, tile: int):
+    return max(frame.shape[:2]) > tile * MIN_SIDE_FACTOR
+
+
+def grid(width: int, height: int, tile: int, overlap: float = TILE_OVERLAP):
+    """覆盖整图的小块 [(x0, y0, x1, y1)]；最后一行 / 列贴齐图片边缘"""
+    stride = max(1, int(tile * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile:
+            return [0]
+        s = list(range(0, length - tile, stride))
+        return s + [length - tile]
+
+    return [(x, y, min(x + tile, width), min(y + tile, height)) for y in starts(height) for x in starts(width)]
+
+
+def spill(image: Image.Image):
+    """
+    图片每次 SPILL_ROWS 行转换成 RGB 写入内存映射文件（H, W, 3 uint8），边写边对映射里的像素求哈希；
+    返回 (只读映射, 像素哈希)。像素相同的图复用已有文件
+    """
+    os.makedirs(TILE_DIR, exist_ok=True)
+    width, height = image.size
+    shape = (height, width, 3)
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=TILE_DIR)
+    os.close(fd)
+    try:
+        h = result_cache.pixel_hasher(width, height)
+        mm = np.memmap(tmp, dtype=np.uint8, mode="w+", shape=shape)
+        for y in range(0, height, SPILL_ROWS):
+            y1 = min(y + SPILL_ROWS, height)
+            mm[y:y1] = np.asarray(image.crop((0, y, width, y1)).convert("RGB"))
+            h.update(mm[y:y1].tobytes())
+        mm.flush()
+        del mm
+        digest = h.hexdigest()
+        path = os.path.join(TILE_DIR, f"{digest}.rgb")
+        if os.path.exists(path):
+            os.remove(tmp)
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    _prune()
+    return np.memmap(path, dtype=np.uint8, mode="r", shape=shape), digest
+
+
+def _prune():
+    files = sorted((e for e in os.scandir(TILE_DIR) if e.name.endswith(".rgb")), key=lambda e: e.stat().st_mtime)
+    for e in files[:-MAX_SPILL_FILES]:
+        try:
+            os.remove(e.path)
+        except OSError:
+            pass
+
+
+def _cut_edges(cands, rect, width: int, height: int):
+    """丢掉碰到内侧块边的框（图片外缘不算）"""
+    x0, y0, x1, y1 = rect
+    b = cands["boxes"]
+    touch = np.zeros(len(b), dtype=bool)
+    if x0 > 0:
+        touch |= b[:, 0] <= EDGE_MARGIN
+    if y0 > 0:
+        touch |= b[:, 1] <= EDGE_MARGIN
+    if x1 < width:
+        touch |= b[:, 2] >= (x1 - x0) - EDGE_MARGIN
+    if y1 < height:
+        touch |= b[:, 3] >= (y1 - y0) - EDGE_MARGIN
+    return ~touch
+
+
+def candidates(engine, frame: np.ndarray, floor: float = detector.CONF_FLOOR):
+    """spill() 得到的映射上分块 + 整图推理合并后的候选框，格式与 Detector.candidates 相同"""
+    tile = engine.size[0]
+    height, width = frame.shape[:2]
+    parts = engine.candidates_many([Image.fromarray(np.asarray(frame))], floor)    # 整图：负责大目标
+    rects = grid(width, height, tile)
+    for i in range(0, len(rects), batcher.MAX_BATCH):
+        chunk = rects[i:i + batcher.MAX_BATCH]
+        tiles = [Image.fromarray(np.ascontiguousarray(frame[y0:y1, x0:x1])) for x0, y0, x1, y1 in chunk]
+        for rect, c in zip(chunk, engine.candidates_many(tiles, floor)):
+            # 块内先做一次 NMS（下限阈值下的幸存框在任何更高阈值下仍是同一结果的超集），减少跨块合并的规模
+            keep = detector.nms(c["boxes"], c["scores"], c["class_ids"], detector.IOU_THRESHOLD)
+            c = {k: v[keep] for k, v in c.items()}
+            inner = _cut_edges(c, rect, width, height)
+            c = {k: v[inner] for k, v in c.items()}
+            c["boxes"] = c["boxes"] + np.array(rect[:2] * 2, dtype=np.float32)
+            parts.append(c)
+    merged = {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+    order = np.argsort(-merged["scores"], kind="stable")[:detector.MAX_CANDIDATES]
+    return {k: v[order] for k, v in merged.items()}
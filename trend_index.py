@@ -0,0 +1,161 @@
+"""
+患病总数的区间统计索引
+- 前缀和：区间内 n / 均值 / 标准差 / 最小二乘斜率 O(1)
+- 分块稀疏表：区间 min / max O(1)（块内直接扫描，块间查稀疏表，内存约 O(n)）
+- 滑动窗口：相邻两个窗口均值之差的区间最大值，用于突变点标记
+区间定位用二分查找 O(log n)；追加数据时只补算尾部
+"""
+import numpy as np
+import pandas as pd
+
+BLOCK = 64              # 分块大小
+ROLLING_WINDOW = 7      # 滑动窗口长度（点数）
+CHANGE_Z = 2.0          # 相邻窗口均值差超过区间标准差的倍数即视为突变
+_DAY_NS = 86_400 * 10 ** 9
+
+
+class _BlockSparseTable:
+    """分块稀疏表：块内 min/max + 块间稀疏表，支持尾部追加"""
+
+    def __init__(self):
+        self.a = np.empty(0)
+        self.bmin = np.empty(0)
+        self.bmax = np.empty(0)
+        self.tmin, self.tmax = [], []
+
+    def update(self, a: np.ndarray, changed_from: int):
+        """a 为完整数组，changed_from 之前的元素与上次相同"""
+        self.a = a
+        first = min(changed_from // BLOCK, len(self.bmin))
+        tail = a[first * BLOCK:]
+        if len(tail):
+            starts = np.arange(0, len(tail), BLOCK)
+            self.bmin = np.concatenate([self.bmin[:first], np.minimum.reduceat(tail, starts)])
+            self.bmax = np.concatenate([self.bmax[:first], np.maximum.reduceat(tail, starts)])
+        self.tmin, self.tmax = [self.bmin], [self.bmax]
+        k = 1
+        while (1 << k) <= len(self.bmin):
+            half = 1 << (k - 1)
+            self.tmin.append(np.minimum(self.tmin[-1][:-half], self.tmin[-1][half:]))
+            self.tmax.append(np.maximum(self.tmax[-1][:-half], self.tmax[-1][half:]))
+            k += 1
+
+    def _blocks(self, lo: int, hi: int):
+        k = (hi - lo).bit_length() - 1
+        r = hi - (1 << k)
+        return min(self.tmin[k][lo], self.tmin[k][r]), max(self.tmax[k][lo], self.tmax[k][r])
+
+    def query(self, lo: int, hi: int):
+        """[lo, hi) 的 (min, max)，要求 hi > lo"""
+        bl, bh = lo // BLOCK, (hi - 1) // BLOCK
+        if bl == bh:
+            seg = self.a[lo:hi]
+            return seg.min(), seg.max()
+        left, right = self.a[lo:(bl + 1) * BLOCK], self.a[bh * BLOCK:hi]
+        lo_v, hi_v = min(left.min(), right.min()), max(left.max(), right.max())
+        if bh - bl > 1:
+            m, x = self._blocks(bl + 1, bh)
+            lo_v, hi_v = min(lo_v, m), max(hi_v, x)
+        return lo_v, hi_v
+
+
+class TrendIndex:
+    """按日期升序的单条序列的统计索引；只支持在末尾追加更晚的日期"""
+
+    def __init__(self, series: pd.Series, window: int = ROLLING_WINDOW):
+        self.window = window
+        self.dates = np.empty(0, dtype="datetime64[ns]")
+        self.values = np.empty(0)
+        self._origin = None
+        # 前缀和，长度 n+1：Σv, Σv², Σx, Σx², Σxv（x 为距首日的天数）
+        self._ps = {k: np.zeros(1) for k in ("v", "vv", "x", "xx", "xv")}
+        self._minmax = _BlockSparseTable()
+        self._jump = np.empty(0)
+        self._jump_max = _BlockSparseTable()
+        self.extend(series)
+
+    def __len__(self):
+        return len(self.values)
+
+    def extend(self, series: pd.Series):
+        if not len(series):
+            return
+        dates = series.index.to_numpy(dtype="datetime64[ns]")
+        values = series.to_numpy(dtype=np.float64)
+        if len(self.dates) and dates[0] <= self.dates[-1]:
+            raise ValueError("只能追加晚于已有数据的日期")
+        old_n = len(self.values)
+        if self._origin is None:
+            self._origin = dates[0]
+        x = (dates - self._origin).astype(np.int64) / _DAY_NS
+
+        self.dates = np.concatenate([self.dates, dates])
+        self.values = np.concatenate([self.values, values])
+        for key, arr in (("v", values), ("vv", values * values), ("x", x), ("xx", x * x), ("xv", x * values)):
+            ps = self._ps[key]
+            self._ps[key] = np.concatenate([ps, ps[-1] + np.cumsum(arr)])
+        self._minmax.update(self.values, old_n)
+
+        # 相邻两个窗口均值之差：jump[i] = |mean(v[i:i+w]) - mean(v[i-w:i])|，只补算受影响的尾部
+        n, w = len(self.values), self.window
+        start = max(w, old_n - w)
+        jump = np.zeros(n)
+        jump[:len(self._jump)] = self._jump
+        jump[start:] = 0.0
+        if n - w >= start:
+            i = np.arange(start, n - w + 1)
+            s = self._ps["v"]
+            jump[i] = np.abs((s[i + w] - s[i]) - (s[i] - s[i - w])) / w
+        self._jump = jump
+        self._jump_max.update(jump, start)
+
+    def _span(self, start=None, end=None):
+        lo = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start), "ns"), "left"))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end), "ns"), "right"))
+        return lo, hi
+
+    def _sum(self, key: str, lo: int, hi: int):
+        ps = self._ps[key]
+        return ps[hi] - ps[lo]
+
+    def query(self, start=None, end=None):
+        """
+        [start, end] 区间的 n / max / min / mean / std / first / last、
+        最小二乘斜率（每天变化的尾数）和是否出现突变；区间为空返回 None
+        """
+        lo, hi = self._span(start, end)
+        n = hi - lo
+        if n <= 0:
+            return None
+        mn, mx = self._minmax.query(lo, hi)
+        sv, svv = self._sum("v", lo, hi), self._sum("vv", lo, hi)
+        mean = sv / n
+        std = float(np.sqrt(max(svv / n - mean * mean, 0.0)))
+
+        slope = 0.0
+        if n > 1:
+            sx, sxx, sxv = self._sum("x", lo, hi), self._sum("xx", lo, hi), self._sum("xv", lo, hi)
+            denom = n * sxx - sx * sx
+            if denom > 0:
+                slope = (n * sxv - sx * sv) / denom
+
+        w = self.window
+        change = False
+        if n >= 2 * w and std > 0:
+            _, jump = self._jump_max.query(lo + w, hi - w + 1)
+            change = bool(jump > CHANGE_Z * std)
+
+        return {
+            "n": n, "max": float(mx), "min": float(mn), "mean": float(mean), "std": std,
+            "first": float(self.values[lo]), "last": float(self.values[hi - 1]),
+            "first_date": pd.Timestamp(self.dates[lo]), "last_date": pd.Timestamp(self.dates[hi - 1]),
+            "slope": float(slope), "change_point": change,
+        }
+
+    def rolling_mean(self, start=None, end=None):
+        """区间内每个点的尾随窗口均值（窗口不足时用已有点），由前缀和直接算出"""
+        lo, hi = self._span(start, end)
+        i = np.arange(lo, hi)
+        left = np.maximum(i + 1 - self.window, 0)
+        s = self._ps["v"]
+        return pd.Series((s[i + 1] - s[left]) / (i + 1 - left), index=pd.DatetimeIndex(self.dates[lo:hi]))
@@ -0,0 +1,227 @@
+"""
+多进程检测池
+- 单进程受 GIL 与预处理开销限制用不满多核；设置 FISH_WORKERS=N 后，图片 / 视频识别分发到 N 个子进程，
+  每个子进程各自加载一份单线程的 ONNX Runtime 会话
+- 帧经共享内存传递：父进程把 uint8 帧拷进共享内存里的一个槽位，子进程直接在槽位上建 numpy 视图读取，
+  队列里只传槽位号和形状，不做 pickle
+- 子进程返回置信度下限以上的候选框数组（detector.candidates），阈值截取与 NMS 在父进程用 detector.select 完成
+- 监控线程发现子进程退出后自动拉起新进程，并把它手上未完成的任务重新派发一次；同一任务再次导致崩溃则报错
+
+吞吐量随进程数的变化见 benchmarks/bench_worker_pool.py
+"""
+import atexit
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import detector
+
+SLOT_BYTES = 1920 * 1080 * 3    # 单帧上限，更大的帧先在父进程等比缩小
+SLOTS_PER_WORKER = 2
+MAX_RETRIES = 1                 # 任务所在进程崩溃后最多重派几次
+MONITOR_INTERVAL = 0.5
+CRASH_LOOP_SECONDS = 5.0        # 子进程启动后这么快就退出算作一次启动失败
+CRASH_LOOP_LIMIT = 3            # 连续启动失败次数上限，超过后不再重启，检测池标记为不可用
+
+_lock = threading.Lock()
+_pools = {}                     # (模型版本, 进程数) -> DetectorPool
+
+
+def _worker_main(model_path, input_size, shm_name, slot_bytes, tasks, results, index):
+    engine = detector.Detector(model_path, threads=1, batching=False, input_size=input_size)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        from PIL import Image
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, slot, shape, floor = task
+            try:
+                # 零拷贝视图：直接读共享内存里的帧
+                frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+                image = Image.fromarray(frame)
+                x, meta = engine.preprocess(image)
+                cands = engine.candidates(engine.infer(x[None])[0], meta, image.size, floor)
+                results.put((index, task_id, True, cands))
+            except Exception as e:
+                results.put((index, task_id, False, str(e)))
+    finally:
+        shm.close()
+
+
+class DetectorPool:
+    def __init__(self, model_path: str, workers: int, version: str = None, input_size: int = None):
+        self.model_path = model_path
+        self.input_size = input_size
+        self.size = (input_size or detector.INPUT_SIZE,) * 2      # 与 Detector.size 一致，供分块检测确定块大小
+        self.version = version
+        self.n = max(1, workers)
+        self._ctx = mp.get_context("spawn")         # 父进程里有 Streamlit 的线程，fork 不安全
+        n_slots = self.n * SLOTS_PER_WORKER
+        self._shm = shared_memory.SharedMemory(create=True, size=SLOT_BYTES * n_slots)
+        self._free = queue.Queue()
+        for i in range(n_slots):
+            self._free.put(i)
+        self._results = self._ctx.Queue()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._pending = {}                          # task_id -> (Future, 槽位, 形状, 置信度下限, 缩放, 重试次数)
+        self._inflight = [set() for _ in range(self.n)]
+        self._procs = [None] * self.n
+        self._queues = [None] * self.n
+        self._started = [0.0] * self.n
+        self._fast_fails = [0] * self.n
+        self.restarts = 0
+        self.error = None
+        self._closed = False
+        for i in range(self.n):
+            self._spawn(i)
+        threading.Thread(target=self._collect, daemon=True).start()
+        threading.Thread(target=self._monitor, daemon=True).start()
+
+    def _spawn(self, i: int):
+        self._queues[i] = self._ctx.Queue()
+        self._procs[i] = self._ctx.Process(
+            target=_worker_main, daemon=True,
+            args=(self.model_path, self.input_size, self._shm.name, SLOT_BYTES, self._queues[i], self._results, i),
+        )
+        self._procs[i].start()
+        self._started[i] = time.monotonic()
+
+    def _dispatch(self, task_id: int):
+        """派给在途任务最少的进程；调用方持有 self._lock"""
+        i = min(range(self.n), key=lambda k: len(self._inflight[k]))
+        _, slot, shape, floor, _, _ = self._pending[task_id]
+        self._inflight[i].add(task_id)
+        self._queues[i].put((task_id, slot, shape, floor))
+
+    def _finish(self, task_id: int):
+        fut, slot, *_ = self._pending.pop(task_id)
+        self._free.put(slot)
+        return fut
+
+    def _collect(self):
+        while not self._closed:
+            try:
+                index, task_id, ok, payload = self._results.get(timeout=MONITOR_INTERVAL)
+            except (queue.Empty, OSError, EOFError):
+                continue
+            with self._lock:
+                self._inflight[index].discard(task_id)
+                if task_id not in self._pending:
+                    continue                        # 已因崩溃重派并由其他进程完成
+                scale = self._pending[task_id][4]
+                fut = self._finish(task_id)
+            if not ok:
+                fut.set_exception(RuntimeError(payload))
+                continue
+            payload["boxes"] /= scale
+            fut.set_result(payload)
+
+    def _monitor(self):
+        while not self._closed:
+            threading.Event().wait(MONITOR_INTERVAL)
+            for i, proc in enumerate(self._procs):
+                if self._closed or proc.is_alive():
+                    continue
+                failed = []
+                with self._lock:
+                    if time.monotonic() - self._started[i] < CRASH_LOOP_SECONDS:
+                        self._fast_fails[i] += 1
+                    else:
+                        self._fast_fails[i] = 0
+                    if self._fast_fails[i] >= CRASH_LOOP_LIMIT:
+                        self._broken(f"检测进程连续 {CRASH_LOOP_LIMIT} 次启动后立即退出（退出码 {proc.exitcode}）")
+                        return
+                    self.restarts += 1
+                    self._spawn(i)
+                    lost, self._inflight[i] = self._inflight[i], set()
+                    for task_id in lost:
+                        if task_id not in self._pending:
+                            continue
+                        fut, slot, shape, floor, scale, retries = self._pending[task_id]
+                        if retries >= MAX_RETRIES:
+                            failed.append((self._finish(task_id), proc.exitcode))
+                        else:
+                            self._pending[task_id] = (fut, slot, shape, floor, scale, retries + 1)
+                            self._dispatch(task_id)
+                for fut, code in failed:
+                    fut.set_exception(RuntimeError(f"检测进程异常退出（退出码 {code}）"))
+
+    def _broken(self, reason: str):
+        """调用方持有 self._lock：不再接收任务，在途任务全部报错"""
+        self.error = reason
+        for task_id in list(self._pending):
+            self._finish(task_id).set_exception(RuntimeError(reason))
+
+    def submit(self, frame: np.ndarray, floor: float = detector.CONF_FLOOR) -> Future:
+        """frame 为 HxWx3 uint8，结果为候选框数组；没有空闲槽位时阻塞等待（自然形成背压）"""
+        if self.error:
+            raise RuntimeError(self.error)
+        scale = 1.0
+        if frame.nbytes > SLOT_BYTES:
+            from PIL import Image
+            scale = (SLOT_BYTES / frame.nbytes) ** 0.5
+            h, w = frame.shape[:2]
+            frame = np.asarray(Image.fromarray(frame).resize((max(1, int(w * scale)), max(1, int(h * scale)))))
+            scale = frame.shape[1] / w
+        slot = self._free.get()
+        np.ndarray(frame.shape, dtype=np.uint8, buffer=self._shm.buf, offset=slot * SLOT_BYTES)[...] = frame
+        fut = Future()
+        with self._lock:
+            task_id = next(self._ids)
+            self._pending[task_id] = (fut, slot, frame.shape, floor, scale, 0)
+            self._dispatch(task_id)
+        return fut
+
+    def candidates_many(self, images, floor: float = detector.CONF_FLOOR):
+        """与 Detector.candidates_many 相同的接口，图片分散到各进程并行处理"""
+        futures = []
+        for image in images:
+            futures.append(self.submit(np.ascontiguousarray(np.asarray(image.convert("RGB"))), floor))
+        return [f.result() for f in futures]
+
+    def detect_many(self, images, conf: float):
+        return [detector.select(c, conf) for c in self.candidates_many(images, conf)]
+
+    def detect(self, image, conf: float):
+        return self.detect_many([image], conf)[0]
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for q in self._queues:
+            q.put(None)
+        for p in self._procs:
+            p.join(timeout=2)
+            if p.is_alive():
+                p.terminate()
+        self._shm.close()
+        self._shm.unlink()
+
+
+def get_pool(model_path: str, workers: int, version: str = None, input_size: int = None):
+    """进程内共享的检测池；模型版本变化（包括切换了变体）时重建"""
+    with _lock:
+        for key, pool in list(_pools.items()):
+            if key[1] == workers and (pool.version != version or pool.error):
+                pool.close()
+                del _pools[key]
+        key = (version, workers)
+        if key not in _pools:
+            _pools[key] = DetectorPool(model_path, workers, version, input_size)
+        return _pools[key]
+
+
+@atexit.register
+def _shutdown():
+    for pool in list(_pools.values()):
+        pool.close()